@@ -9,17 +9,192 @@ from pathlib import Path
 import asyncio
 import logging
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 from concurrent.futures import ThreadPoolExecutor
+import os
+import re
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# Thread pool for JPEG encoding in the stream endpoint
+# Thread pool for JPEG encoding in the stream and snapshot endpoints
 _encode_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="jpeg-encode")
 
 
+def _encode_jpeg(frame: np.ndarray, quality: int = 95) -> bytes:
+    """Encode a BGR frame as JPEG bytes (runs in the encode executor)"""
+    ok, buf = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    if not ok:
+        raise RuntimeError("JPEG encoding failed")
+    return buf.tobytes()
+
+
+# Credentials in an RTSP URL: keep scheme + user, mask everything up to the
+# last '@' before the host so passwords containing '@' are fully hidden
+_RTSP_PASSWORD_RE = re.compile(r'^([A-Za-z][\w+.-]*://[^:/@]+:)[^/]*@')
+
+# MJPEG multipart framing, built once
+_MJPEG_HEADER = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+_MJPEG_FOOTER = b'\r\n'
+
+# Last framed part per quality, keyed by the identity of the shared JPEG bytes
+_mjpeg_part_cache: Dict[int, Tuple[bytes, bytes]] = {}
+
+# Per-viewer backpressure: a send slower than this means the client can't keep
+# up, so its quality steps down; it steps back up after a run of fast sends
+_SLOW_SEND_SECONDS = 0.2
+_QUALITY_STEP = 10
+_MIN_STREAM_QUALITY = 30
+_RECOVER_AFTER_FRAMES = 30
+
+
+def _mjpeg_part(jpeg: bytes, quality: int) -> bytes:
+    """Wrap a JPEG in multipart framing — built once per frame for all viewers"""
+    cached = _mjpeg_part_cache.get(quality)
+    if cached is not None and cached[0] is jpeg:
+        return cached[1]
+    part = b''.join((_MJPEG_HEADER, jpeg, _MJPEG_FOOTER))
+    _mjpeg_part_cache[quality] = (jpeg, part)
+    return part
+
+
+def _encode_mjpeg_part(camera, quality: int) -> Optional[bytes]:
+    """Shared encode plus framing in one executor call, returning send-ready bytes"""
+    jpeg = camera.get_jpeg(quality)
+    if jpeg is None:
+        return None
+    return _mjpeg_part(jpeg, quality)
+
+
+class LargeChunkFileResponse(FileResponse):
+    """
+    FileResponse streaming 1 MiB chunks instead of 64 KiB, cutting per-chunk
+    thread-hop/dispatch overhead on large videos. (uvicorn doesn't advertise
+    the ASGI pathsend extension, so there is no sendfile path to take.)
+    """
+    chunk_size = 1024 * 1024
+
+
+def _read_prefix(path: Path, size: int, chunk_size: int):
+    """Yield the first ``size`` bytes of a file (iterated in a worker thread)"""
+    with open(path, 'rb') as f:
+        remaining = size
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _video_response(service, video_path: Path, filename: Optional[str] = None):
+    """
+    Serve a timelapse video. The video the encoder is still writing grows while
+    it is sent, so it is cut at its current size instead of being read to EOF
+    (which would overrun Content-Length); players stop at the last whole fragment.
+    """
+    if not service.is_writing(video_path):
+        headers = None if filename else {"Accept-Ranges": "bytes"}
+        return LargeChunkFileResponse(video_path, media_type="video/mp4", filename=filename, headers=headers)
+    
+    size = video_path.stat().st_size
+    headers = {"Content-Length": str(size)}
+    if filename:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return StreamingResponse(
+        _read_prefix(video_path, size, LargeChunkFileResponse.chunk_size),
+        media_type="video/mp4",
+        headers=headers,
+    )
+
+
+# Timelapse downloads at a non-default fps are re-timed copies cached in
+# timelapse/exports; only the most recently used few are kept
+_MAX_EXPORTS = 8
+_export_locks: Dict[str, asyncio.Lock] = {}
+
+
+async def _export_at_fps(daily_video: Path, date: str, fps: int, video_fps: int) -> Path:
+    """
+    Re-time the daily video at ``fps`` by scaling timestamps (stream copy, no
+    re-encode). Cached in a subdirectory (kept out of the date listing) until
+    the daily video grows again; one export per (date, fps) runs at a time.
+    """
+    export_dir = daily_video.parent / "exports"
+    export_dir.mkdir(exist_ok=True)
+    key = f"{date}_{fps}fps"
+    video_path = export_dir / f"{key}.mp4"
+    
+    lock = _export_locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        # A concurrent request may have just produced it
+        if video_path.exists() and video_path.stat().st_mtime >= daily_video.stat().st_mtime:
+            os.utime(video_path)  # Mark as recently used for pruning
+            return video_path
+        
+        # Write beside the cache entry and swap it in, so no request ever serves a partial file
+        temp_path = export_dir / f"{key}.tmp.mp4"
+        cmd = [
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-itsscale', f'{video_fps / fps:.6f}',
+            '-i', str(daily_video),
+            '-c', 'copy',
+            str(temp_path)
+        ]
+        proc = None
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            _, stderr = await asyncio.wait_for(proc.communicate(), timeout=120)
+            
+            if proc.returncode != 0:
+                raise HTTPException(status_code=500, detail=f"Video compilation failed: {stderr.decode()}")
+            os.replace(temp_path, video_path)
+                
+        except asyncio.TimeoutError:
+            try:
+                proc.kill()
+                await proc.wait()  # Reap the killed process
+            except Exception:
+                pass
+            raise HTTPException(status_code=500, detail="Video compilation timed out")
+        except FileNotFoundError:
+            raise HTTPException(status_code=500, detail="ffmpeg not installed. Please install ffmpeg to compile videos.")
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error compiling video: {str(e)}")
+        finally:
+            temp_path.unlink(missing_ok=True)  # Drop any partial output
+    
+    _prune_exports(export_dir)
+    return video_path
+
+
+def _prune_exports(export_dir: Path):
+    """Delete all but the _MAX_EXPORTS most recently used exports"""
+    exports = sorted(
+        (p for p in export_dir.glob("*.mp4") if not p.name.endswith(".tmp.mp4")),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True,
+    )
+    for old in exports[_MAX_EXPORTS:]:
+        lock = _export_locks.get(old.stem)
+        if lock is not None and lock.locked():
+            continue
+        _export_locks.pop(old.stem, None)
+        old.unlink(missing_ok=True)
+
+
+def _get_service(request: Request, class_name: str):
+    """Look up a running service by class name (None if not enabled)"""
+    return request.app.state.services_by_name.get(class_name)
+
+
 @router.get("/status")
 async def get_status(request: Request):
     """Get system status"""
@@ -47,42 +222,65 @@ async def video_stream(request: Request):
         raise HTTPException(status_code=503, detail="Camera not available")
     
     async def generate():
-        from app.config import settings
+        # Module reference (not the settings object) so a settings reload
+        # takes effect on streams that are already open
+        from app import config
+        camera.add_viewer()
         try:
             loop = asyncio.get_running_loop()
+            last_count = -1
+            quality_drop = 0
+            fast_sends = 0
+            # No per-frame request.is_disconnected() poll: StreamingResponse
+            # already listens for http.disconnect in a concurrent task and
+            # cancels this generator (or the next send fails) when the client goes
             while True:
-                # Check if client disconnected
-                if await request.is_disconnected():
-                    break
-                    
-                frame = camera.get_frame()
-                if frame is not None:
-                    try:
-                        # Encode frame as JPEG in executor to avoid blocking event loop
-                        def encode_frame(f, quality):
-                            param = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
-                            _, buf = cv2.imencode('.jpg', f, param)
-                            return buf.tobytes()
-                        
-                        frame_bytes = await loop.run_in_executor(
-                            _encode_executor,
-                            encode_frame,
-                            frame,
-                            settings.advanced.jpeg_quality_live
-                        )
-                        
-                        yield (b'--frame\r\n'
-                               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-                    except Exception as e:
-                        logger.error(f"Error encoding frame: {e}")
-                        await asyncio.sleep(0.1)
-                        continue
+                # Pace the stream by the camera: only send when a new frame exists
+                frame_count = await camera.wait_for_frame(last_count)
+                if frame_count == last_count:
+                    continue
+                last_count = frame_count
+                
+                # A slow client simply skips the frames captured while its last
+                # send was in flight; it also gets a lower JPEG quality
+                base_quality = config.settings.advanced.jpeg_quality_live
+                quality_drop = min(quality_drop, max(0, base_quality - _MIN_STREAM_QUALITY))
+                quality = base_quality - quality_drop
+                
+                try:
+                    # Shared encode and framing — all viewers of the same frame
+                    # and quality reuse one part, and neither step runs on the loop
+                    part = await loop.run_in_executor(
+                        _encode_executor,
+                        _encode_mjpeg_part,
+                        camera,
+                        quality
+                    )
+                except Exception as e:
+                    logger.error(f"Error encoding frame: {e}")
+                    await asyncio.sleep(0.1)
+                    continue
+                
+                if part is None:
+                    continue
                 
-                await asyncio.sleep(0.066)  # ~15 FPS for live view — matches capture rate
+                # The generator resumes only once the chunk has been sent
+                send_start = loop.time()
+                yield part
+                if loop.time() - send_start > _SLOW_SEND_SECONDS:
+                    quality_drop += _QUALITY_STEP
+                    fast_sends = 0
+                elif quality_drop:
+                    fast_sends += 1
+                    if fast_sends >= _RECOVER_AFTER_FRAMES:
+                        quality_drop -= _QUALITY_STEP
+                        fast_sends = 0
         except asyncio.CancelledError:
             pass
         except Exception as e:
             logger.error(f"Stream error: {e}", exc_info=True)
+        finally:
+            camera.remove_viewer()
     
     return StreamingResponse(
         generate(),
@@ -101,56 +299,50 @@ async def get_snapshot(request: Request):
     if frame is None:
         raise HTTPException(status_code=503, detail="No frame available")
     
-    _, buffer = cv2.imencode('.jpg', frame)
-    return Response(content=buffer.tobytes(), media_type="image/jpeg")
+    loop = asyncio.get_running_loop()
+    frame_bytes = await loop.run_in_executor(_encode_executor, _encode_jpeg, frame)
+    return Response(content=frame_bytes, media_type="image/jpeg")
 
 
 @router.get("/timelapse/dates")
 async def get_timelapse_dates(request: Request):
     """Get available timelapse dates"""
-    services = request.app.state.services
-    for service in services:
-        if service.__class__.__name__ == "TimelapseService":
-            return {"dates": service.get_available_dates()}
-    raise HTTPException(status_code=404, detail="Timelapse service not found")
+    service = _get_service(request, "TimelapseService")
+    if not service:
+        raise HTTPException(status_code=404, detail="Timelapse service not found")
+    
+    # Today is always listed, even before its first segment is compiled
+    return {"dates": service.get_available_dates()}
 
 
 @router.get("/timelapse/frames/{date}")
 async def get_timelapse_frames(date: str, request: Request):
     """Get video info for a specific date"""
-    services = request.app.state.services
-    for service in services:
-        if service.__class__.__name__ == "TimelapseService":
-            video_path = service.get_video_path(date)
-            if video_path.exists():
-                return {
-                    "date": date,
-                    "type": "video",
-                    "path": str(video_path.name),
-                    "exists": True
-                }
-            else:
-                return {
-                    "date": date,
-                    "type": "video",
-                    "exists": False,
-                    "message": "Video not yet created or no frames captured for this date"
-                }
-    raise HTTPException(status_code=404, detail="Timelapse service not found")
+    service = _get_service(request, "TimelapseService")
+    if not service:
+        raise HTTPException(status_code=404, detail="Timelapse service not found")
+    
+    frames = service.get_frames_for_date(date)
+    if frames:
+        return {
+            "date": date,
+            "type": "video",
+            "path": frames[0]["filename"],
+            "exists": True
+        }
+    return {
+        "date": date,
+        "type": "video",
+        "exists": False,
+        "message": "Video not yet created or no frames captured for this date"
+    }
 
 
 @router.get("/timelapse/video/{date}")
 async def get_timelapse_video(date: str, request: Request):
     """Stream timelapse video file directly"""
     from app.config import settings
-    services = request.app.state.services
-    
-    timelapse_service = None
-    for service in services:
-        if service.__class__.__name__ == "TimelapseService":
-            timelapse_service = service
-            break
-    
+    timelapse_service = _get_service(request, "TimelapseService")
     if not timelapse_service:
         raise HTTPException(status_code=404, detail="Timelapse service not found")
     
@@ -158,11 +350,7 @@ async def get_timelapse_video(date: str, request: Request):
     if not video_path.exists():
         raise HTTPException(status_code=404, detail=f"No video found for {date}")
     
-    return FileResponse(
-        video_path,
-        media_type="video/mp4",
-        headers={"Accept-Ranges": "bytes"}
-    )
+    return _video_response(timelapse_service, video_path)
 
 
 @router.get("/timelapse/play/{date}")
@@ -173,151 +361,84 @@ async def play_timelapse_legacy(date: str, speed: int = 24, request: Request = N
 
 @router.get("/timelapse/download/{date}")
 async def download_timelapse_video(date: str, fps: int = 24, request: Request = None):
-    """Compile and download timelapse as MP4 video"""
+    """Download timelapse as MP4 video"""
     from app.config import settings
-    import tempfile
-    
-    services = request.app.state.services
-    
-    timelapse_service = None
-    for service in services:
-        if service.__class__.__name__ == "TimelapseService":
-            timelapse_service = service
-            break
     
+    timelapse_service = _get_service(request, "TimelapseService")
     if not timelapse_service:
         raise HTTPException(status_code=404, detail="Timelapse service not found")
     
-    frames = timelapse_service.get_frames_for_date(date)
-    if not frames:
+    # Frames are compiled into the daily video incrementally, so the download
+    # is that file — no per-frame manifest or re-encode needed
+    daily_video = timelapse_service.get_video_path(date)
+    if not daily_video.exists():
         raise HTTPException(status_code=404, detail="No frames found for date")
     
-    # Check if compiled video already exists
-    base_path = Path(settings.storage.base_path) / "timelapse"
-    video_path = base_path / f"timelapse_{date}.mp4"
+    video_fps = settings.timelapse.video_fps
+    if fps <= 0:
+        raise HTTPException(status_code=400, detail="fps must be positive")
     
-    if not video_path.exists():
-        # Compile video using ffmpeg (async subprocess to avoid blocking)
-        try:
-            # Create temporary file list
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as f:
-                list_file = f.name
-                for frame_info in frames:
-                    frame_path = base_path / frame_info["path"]
-                    if frame_path.exists():
-                        f.write(f"file '{frame_path.absolute()}'\n")
-                        f.write(f"duration {1.0/fps}\n")
-                # Duplicate last frame to ensure it shows
-                if frames:
-                    last_frame = base_path / frames[-1]["path"]
-                    if last_frame.exists():
-                        f.write(f"file '{last_frame.absolute()}'\n")
-            
-            cmd = [
-                'ffmpeg', '-y',
-                '-f', 'concat',
-                '-safe', '0',
-                '-i', list_file,
-                '-vf', f'fps={fps}',
-                '-pix_fmt', 'yuv420p',
-                '-c:v', 'libx264',
-                '-preset', 'medium',
-                '-crf', '23',
-                str(video_path)
-            ]
-            
-            proc = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-            )
-            _, stderr = await asyncio.wait_for(proc.communicate(), timeout=120)
-            
-            # Clean up temp file
-            Path(list_file).unlink(missing_ok=True)
-            
-            if proc.returncode != 0:
-                raise HTTPException(status_code=500, detail=f"Video compilation failed: {stderr.decode()}")
-                
-        except asyncio.TimeoutError:
-            try:
-                proc.kill()
-            except Exception:
-                pass
-            raise HTTPException(status_code=500, detail="Video compilation timed out")
-        except FileNotFoundError:
-            raise HTTPException(status_code=500, detail="ffmpeg not installed. Please install ffmpeg to compile videos.")
-        except HTTPException:
-            raise
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error compiling video: {str(e)}")
+    video_path = daily_video
+    if fps != video_fps:
+        video_path = await _export_at_fps(daily_video, date, fps, video_fps)
     
-    return FileResponse(
-        video_path,
-        media_type="video/mp4",
-        filename=f"skywatch_timelapse_{date}.mp4"
-    )
+    return _video_response(timelapse_service, video_path, filename=f"skywatch_timelapse_{date}.mp4")
 
 
 @router.get("/solargraph/composite")
 async def get_solargraph_composite(request: Request):
     """Get solargraph composite image"""
-    services = request.app.state.services
-    for service in services:
-        if service.__class__.__name__ == "SolargraphService":
-            composite_path = service.get_composite_path()
-            if composite_path.exists():
-                return FileResponse(composite_path)
-            else:
-                raise HTTPException(status_code=404, detail="Composite not yet created")
-    raise HTTPException(status_code=404, detail="Solargraph service not found")
+    service = _get_service(request, "SolargraphService")
+    if not service:
+        raise HTTPException(status_code=404, detail="Solargraph service not found")
+    
+    await service.save_composite()
+    if not service.has_composite():
+        raise HTTPException(status_code=404, detail="Composite not yet created")
+    return LargeChunkFileResponse(service.get_composite_path())
 
 
 @router.post("/solargraph/reset")
 async def reset_solargraph(request: Request):
     """Reset/clear the solargraph composite"""
-    services = request.app.state.services
-    for service in services:
-        if service.__class__.__name__ == "SolargraphService":
-            service.reset_composite()
-            return {"message": "Solargraph composite reset successfully"}
-    raise HTTPException(status_code=404, detail="Solargraph service not found")
+    service = _get_service(request, "SolargraphService")
+    if not service:
+        raise HTTPException(status_code=404, detail="Solargraph service not found")
+    service.reset_composite()
+    return {"message": "Solargraph composite reset successfully"}
 
 
 @router.get("/lunar/composite")
 async def get_lunar_composite(request: Request):
     """Get lunar composite image"""
-    services = request.app.state.services
-    for service in services:
-        if service.__class__.__name__ == "LunarService":
-            composite_path = service.get_composite_path()
-            if composite_path.exists():
-                return FileResponse(composite_path)
-            else:
-                raise HTTPException(status_code=404, detail="Composite not yet created")
-    raise HTTPException(status_code=404, detail="Lunar service not found")
+    service = _get_service(request, "LunarService")
+    if not service:
+        raise HTTPException(status_code=404, detail="Lunar service not found")
+    
+    await service.save_composite()
+    if not service.has_composite():
+        raise HTTPException(status_code=404, detail="Composite not yet created")
+    return LargeChunkFileResponse(service.get_composite_path())
 
 
 @router.post("/lunar/reset")
 async def reset_lunar(request: Request):
     """Reset/clear the lunar composite"""
-    services = request.app.state.services
-    for service in services:
-        if service.__class__.__name__ == "LunarService":
-            service.reset_composite()
-            return {"message": "Lunar composite reset successfully"}
-    raise HTTPException(status_code=404, detail="Lunar service not found")
+    service = _get_service(request, "LunarService")
+    if not service:
+        raise HTTPException(status_code=404, detail="Lunar service not found")
+    service.reset_composite()
+    return {"message": "Lunar composite reset successfully"}
 
 
 @router.get("/motion/events")
 async def get_motion_events(limit: int = 20, request: Request = None):
     """Get recent motion detection events"""
-    services = request.app.state.services
-    for service in services:
-        if service.__class__.__name__ == "MotionDetectionService":
-            events = service.get_recent_events(limit)
-            return {"events": events, "count": len(events)}
-    raise HTTPException(status_code=404, detail="Motion detection service not found")
+    service = _get_service(request, "MotionDetectionService")
+    if not service:
+        raise HTTPException(status_code=404, detail="Motion detection service not found")
+    events = service.get_recent_events(limit)
+    return {"events": events, "count": len(events)}
 
 
 @router.get("/storage/{path:path}")
@@ -332,32 +453,25 @@ async def get_storage_file(path: str):
     if not file_path.is_file():
         raise HTTPException(status_code=400, detail="Not a file")
     
-    return FileResponse(file_path)
+    return LargeChunkFileResponse(file_path)
 
 
 @router.get("/settings")
 async def get_settings():
     """Get current settings"""
     from app.settings import load_settings
-    import copy
     try:
         settings = load_settings()
-        # Create a deep copy to avoid modifying the original
-        settings_copy = copy.deepcopy(settings)
         
-        # Remove sensitive data from response
-        if 'camera' in settings_copy and 'rtsp_url' in settings_copy['camera']:
-            # Mask password in RTSP URL
-            url = settings_copy['camera']['rtsp_url']
-            if '@' in url and '://' in url:
-                protocol = url.split('://')[0]
-                rest = url.split('://')[1]
-                if '@' in rest:
-                    creds, location = rest.split('@', 1)
-                    if ':' in creds:
-                        user = creds.split(':')[0]
-                        settings_copy['camera']['rtsp_url'] = f"{protocol}://{user}:****@{location}"
-        return settings_copy
+        # Remove sensitive data from response — only the camera section is
+        # rewritten, so a shallow copy of it is all that's needed
+        camera = settings.get('camera')
+        if isinstance(camera, dict) and isinstance(camera.get('rtsp_url'), str):
+            settings = {
+                **settings,
+                'camera': {**camera, 'rtsp_url': _RTSP_PASSWORD_RE.sub(r'\1****@', camera['rtsp_url'])},
+            }
+        return settings
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
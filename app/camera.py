@@ -5,34 +5,84 @@ import asyncio
 import logging
 import cv2
 import numpy as np
-from typing import Optional, List, Callable
+from typing import Optional, List, Callable, Dict, NamedTuple, Tuple
 from datetime import datetime
 import threading
 import time
 
 logger = logging.getLogger(__name__)
 
+# Minimum spacing between published frames (~15 FPS — sufficient for all services)
+PUBLISH_INTERVAL = 0.066
+# A get_frame() call keeps full-rate frame retrieval active for this many seconds
+DEMAND_WINDOW = 2.0
+# With no demand at all, still retrieve one frame this often so pollers never see stale data
+IDLE_RETRIEVE_INTERVAL = 1.0
+# Width of the shared downscaled frame for consumers that don't need full resolution
+PREVIEW_WIDTH = 960
+# get_stats() reformats last_frame_time at most this often (ns) on a running stream
+STATS_TIME_REFRESH_NS = 1_000_000_000
+
+
+class FrameState(NamedTuple):
+    """Latest published frame and its metadata, replaced as a whole"""
+    frame: Optional[np.ndarray]
+    count: int
+    mono_ns: Optional[int]  # time.monotonic_ns() at publish
+    wall_ns: Optional[int]  # time.time_ns() at publish
+
 
 class CameraManager:
     """Manages RTSP camera connection and frame distribution"""
     
     def __init__(self, rtsp_url: str, reconnect_interval: int = 5):
         self.rtsp_url = rtsp_url
+        self._gst_pipeline = self._build_gst_pipeline(rtsp_url)  # Built once per URL, not per reconnect
         self.reconnect_interval = reconnect_interval
         self.cap: Optional[cv2.VideoCapture] = None
+        # Cached cap.isOpened(): set after a successful test read, cleared on
+        # every release, so the hot loop and get_stats() skip the FFI call
+        self._cap_open = False
         self.is_running = False
-        self.current_frame: Optional[np.ndarray] = None
-        self.frame_lock = threading.Lock()
         self.subscribers: List[Callable] = []
-        self.frame_count = 0
-        self.last_frame_time: Optional[datetime] = None
+        
+        # Single-reference publication: the capture thread swaps in a new
+        # FrameState and readers grab it in one load — atomic under the GIL,
+        # so no lock is needed and frame/count/time always stay consistent
+        self._state = FrameState(None, 0, None, None)
+        self._stats_time: Tuple[Optional[int], Optional[str]] = (None, None)  # (mono_ns, ISO string)
         
         # Dedicated capture thread — keeps OpenCV completely off the event loop
         self._capture_thread: Optional[threading.Thread] = None
         
+        # New-frame notification for async consumers (set from the capture thread
+        # via call_soon_threadsafe) and a single shared JPEG encode per frame
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._frame_event: Optional[asyncio.Event] = None
+        self._frame_waiters = 0  # Coroutines inside wait_for_frame() (event loop only)
+        self._jpeg_lock = threading.Lock()
+        self._jpeg_count = -1  # Frame the cached encodes below belong to
+        self._jpeg_cache: Dict[int, bytes] = {}  # quality -> JPEG bytes
+        self._jpeg_params: Dict[int, List[int]] = {}  # quality -> imencode params
+        
+        # Single shared downscale per frame. Holding the source reference keeps
+        # it alive, so its identity can't be reused and the check stays valid
+        self._preview_lock = threading.Lock()
+        self._preview_source: Optional[np.ndarray] = None
+        self._preview: Optional[np.ndarray] = None
+        self._gray_source: Optional[np.ndarray] = None
+        self._gray: Optional[np.ndarray] = None
+        
+        # Demand tracking for selective retrieval (grab always, retrieve on demand)
+        self._viewers = 0
+        self._last_frame_request = 0.0
+        self._last_retrieve = 0.0
+        
     async def start(self):
         """Start camera capture in a dedicated thread"""
         self.is_running = True
+        self._loop = asyncio.get_running_loop()
+        self._frame_event = asyncio.Event()
         self._capture_thread = threading.Thread(
             target=self._capture_thread_main,
             name="camera-capture",
@@ -46,6 +96,7 @@ class CameraManager:
         self.is_running = False
         if self._capture_thread and self._capture_thread.is_alive():
             self._capture_thread.join(timeout=5.0)
+        self._cap_open = False
         if self.cap:
             try:
                 self.cap.release()
@@ -66,20 +117,30 @@ class CameraManager:
         while self.is_running:
             try:
                 # Connect if needed
-                if not self.cap or not self.cap.isOpened():
+                if not self._cap_open:
                     self._connect_sync()
-                    if not self.cap or not self.cap.isOpened():
+                    if not self._cap_open:
                         time.sleep(self.reconnect_interval)
                         continue
                     consecutive_failures = 0
                 
-                ret, frame = self.cap.read()
+                # grab() blocks until the source delivers the next frame, so it
+                # paces this loop and keeps the stream drained. The backends
+                # demux and decode inside grab(); retrieve() only converts to
+                # BGR and copies out, which is all an idle tick skips
+                ret = self.cap.grab()
+                frame = None
+                if ret:
+                    if not self._needs_retrieve():
+                        consecutive_failures = 0
+                        continue
+                    # A fresh array per retrieve: published frames are shared
+                    # read-only, so they must never be written over
+                    ret, frame = self.cap.retrieve()
+                    self._last_retrieve = time.monotonic()
                 
                 if ret and frame is not None:
-                    with self.frame_lock:
-                        self.current_frame = frame  # No copy — we own this reference
-                        self.frame_count += 1
-                        self.last_frame_time = datetime.now()
+                    self._publish_frame(frame)  # No copy — we own this reference
                     consecutive_failures = 0
                 else:
                     consecutive_failures += 1
@@ -91,9 +152,6 @@ class CameraManager:
                         time.sleep(0.05)
                     continue
                 
-                # Throttle to ~15 FPS — sufficient for all services, much lower CPU
-                time.sleep(0.066)
-                
             except Exception as e:
                 logger.error(f"Error in capture thread: {e}", exc_info=True)
                 consecutive_failures += 1
@@ -103,10 +161,22 @@ class CameraManager:
                 else:
                     time.sleep(0.5)
     
+    def _needs_retrieve(self) -> bool:
+        """Whether the grabbed frame should be converted and published (called from capture thread only)"""
+        now = time.monotonic()
+        since_retrieve = now - self._last_retrieve
+        if since_retrieve < PUBLISH_INTERVAL:
+            return False
+        if self._viewers > 0:
+            return True
+        return (now - self._last_frame_request < DEMAND_WINDOW
+                or since_retrieve >= IDLE_RETRIEVE_INTERVAL)
+    
     def _connect_sync(self):
         """Connect to RTSP stream (called from capture thread only)"""
         try:
             logger.info(f"Connecting to camera: {self.rtsp_url}")
+            self._cap_open = False
             
             # Release any existing capture
             if self.cap:
@@ -116,12 +186,7 @@ class CameraManager:
                     pass
             
             # Try GStreamer first, fallback to default
-            gst_pipeline = (
-                f"rtspsrc location={self.rtsp_url} latency=0 ! "
-                "rtph264depay ! h264parse ! avdec_h264 ! "
-                "videoconvert ! appsink"
-            )
-            cap = cv2.VideoCapture(gst_pipeline, cv2.CAP_GSTREAMER)
+            cap = cv2.VideoCapture(self._gst_pipeline, cv2.CAP_GSTREAMER)
             
             if not cap.isOpened():
                 logger.info("GStreamer failed, trying default backend...")
@@ -135,11 +200,9 @@ class CameraManager:
                 ret, frame = cap.read()
                 if ret and frame is not None:
                     logger.info(f"Camera connected - frame size: {frame.shape}")
-                    with self.frame_lock:
-                        self.current_frame = frame
-                        self.frame_count += 1
-                        self.last_frame_time = datetime.now()
+                    self._publish_frame(frame)
                     self.cap = cap
+                    self._cap_open = True
                 else:
                     logger.warning("Camera opened but cannot read frames")
                     cap.release()
@@ -151,8 +214,24 @@ class CameraManager:
             logger.error(f"Exception during camera connection: {e}", exc_info=True)
             self.cap = None
     
+    @staticmethod
+    def _build_gst_pipeline(rtsp_url: str) -> str:
+        """
+        GStreamer pipeline for an RTSP URL. decodebin picks the highest-ranked
+        H.264 decoder, so a hardware one (VA-API, NVDEC, V4L2) is used when
+        installed; the appsink keeps only the newest BGR frame instead of
+        queueing and never waits on clock sync.
+        """
+        return (
+            f"rtspsrc location={rtsp_url} latency=0 ! "
+            "rtph264depay ! h264parse ! decodebin ! "
+            "videoconvert ! video/x-raw,format=BGR ! "
+            "appsink max-buffers=1 drop=true sync=false"
+        )
+    
     def _reconnect_sync(self):
         """Reconnect to camera (called from capture thread only)"""
+        self._cap_open = False
         if self.cap:
             try:
                 self.cap.release()
@@ -162,12 +241,203 @@ class CameraManager:
         time.sleep(self.reconnect_interval)
         self._connect_sync()
         
-    def get_frame(self) -> Optional[np.ndarray]:
-        """Get current frame (thread-safe). Returns a copy."""
-        with self.frame_lock:
-            if self.current_frame is not None:
-                return self.current_frame.copy()
-        return None
+    @property
+    def current_frame(self) -> Optional[np.ndarray]:
+        """Latest published frame (shared reference, read-only by contract)"""
+        return self._state.frame
+    
+    @property
+    def frame_count(self) -> int:
+        """Number of frames published so far"""
+        return self._state.count
+    
+    @property
+    def last_frame_time(self) -> Optional[datetime]:
+        """Wall-clock time of the latest published frame"""
+        return self._to_wall(self._state.wall_ns)
+    
+    def _to_wall(self, wall_ns: Optional[int]) -> Optional[datetime]:
+        """Convert a time.time_ns() frame stamp to local wall-clock time"""
+        if wall_ns is None:
+            return None
+        return datetime.fromtimestamp(wall_ns / 1e9)
+    
+    def _publish_frame(self, frame: np.ndarray):
+        """Publish a new frame to readers (called from capture thread only)"""
+        # One array is shared by every reader — enforce the
+        # read-only contract so an in-place edit fails loudly instead of
+        # corrupting everyone else's view
+        frame.setflags(write=False)
+        # Both clocks are vDSO reads: monotonic for intervals, wall for display,
+        # which follows NTP steps and DST because it is converted only when read
+        self._state = FrameState(frame, self._state.count + 1, time.monotonic_ns(), time.time_ns())
+        self._notify_new_frame()
+    
+    def _notify_new_frame(self):
+        """Wake async frame waiters (called from capture thread only)"""
+        # Nobody waiting: don't wake the loop at all
+        if self._loop is None or not self._frame_waiters:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._set_frame_event)
+        except RuntimeError:
+            # Event loop already closed during shutdown
+            pass
+    
+    def _set_frame_event(self):
+        """Release everyone waiting on the current frame (runs on the event loop)"""
+        event = self._frame_event
+        self._frame_event = asyncio.Event()
+        if event is not None:
+            event.set()
+    
+    async def wait_for_frame(self, last_count: int, timeout: float = 1.0) -> int:
+        """
+        Wait until a frame newer than ``last_count`` has been captured.
+        Returns the current frame count (unchanged if the wait timed out).
+        """
+        if self._frame_event is None:
+            return self.frame_count
+        # Register before checking the count: the capture thread publishes
+        # first and reads the waiter count second, so a frame is never missed
+        self._frame_waiters += 1
+        try:
+            if self.frame_count != last_count:
+                return self.frame_count
+            await asyncio.wait_for(self._frame_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._frame_waiters -= 1
+        return self.frame_count
+    
+    async def capture_burst(self, count: int, fps: float) -> List[np.ndarray]:
+        """
+        Collect up to ``count`` frames paced at ``fps`` on a fixed schedule,
+        so the burst doesn't drift. Every frame is a newly captured one (never
+        a repeat); the rate is capped by PUBLISH_INTERVAL. Frames that don't
+        arrive in time (camera stalled) are skipped.
+        """
+        frames: List[np.ndarray] = []
+        interval = 1.0 / fps
+        next_due = time.monotonic()
+        last_count = self.frame_count
+        for _ in range(count):
+            delay = next_due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            next_due += interval
+            # Register demand so the capture thread keeps retrieving at full rate
+            self._last_frame_request = time.monotonic()
+            await self.wait_for_frame(last_count, timeout=max(interval, 1.0))
+            last_count, frame = self.get_new_frame(last_count)
+            if frame is not None:
+                frames.append(frame)
+        return frames
+    
+    def get_jpeg(self, quality: int) -> Optional[bytes]:
+        """
+        Get the current frame as JPEG bytes. The encode is shared: every
+        caller asking for the same frame at the same quality gets the cached
+        result. Blocking — call from an executor, not the event loop.
+        """
+        with self._jpeg_lock:
+            state = self._state
+            frame = state.frame
+            if frame is None:
+                return None
+            if state.count != self._jpeg_count:
+                self._jpeg_count = state.count
+                self._jpeg_cache = {}
+            jpeg = self._jpeg_cache.get(quality)
+            if jpeg is None:
+                params = self._jpeg_params.get(quality)
+                if params is None:
+                    params = self._jpeg_params[quality] = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+                ok, buf = cv2.imencode('.jpg', frame, params)
+                if not ok:
+                    return None
+                jpeg = self._jpeg_cache[quality] = buf.tobytes()
+            return jpeg
+        
+    def get_frame(self, copy: bool = False) -> Optional[np.ndarray]:
+        """
+        Get current frame (thread-safe).
+        
+        Every captured frame is a freshly allocated array that the capture
+        thread never touches again, so by default the shared reference is
+        returned without copying. It is flagged read-only; pass ``copy=True``
+        to get a private array that may be modified in place.
+        """
+        self._last_frame_request = time.monotonic()
+        frame = self._state.frame
+        if frame is not None and copy:
+            return frame.copy()
+        return frame
+        
+    def get_new_frame(self, last_count: int = -1) -> Tuple[int, Optional[np.ndarray]]:
+        """
+        Get the current frame only if it is newer than ``last_count``.
+        Returns ``(frame_count, frame)``; frame is None when nothing new has
+        been captured since, so pollers can skip reprocessing a stale frame.
+        """
+        self._last_frame_request = time.monotonic()
+        state = self._state
+        if state.count == last_count:
+            return state.count, None
+        return state.count, state.frame
+        
+    def get_preview(self, frame: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """
+        Get ``frame`` (the current frame by default) downscaled to
+        PREVIEW_WIDTH, read-only. The resize is shared: every caller asking
+        for the same frame gets the cached result. Blocking — call from an
+        executor, not the event loop.
+        """
+        if frame is None:
+            frame = self.get_frame()
+            if frame is None:
+                return None
+        with self._preview_lock:
+            if frame is self._preview_source:
+                return self._preview
+            height, width = frame.shape[:2]
+            if width <= PREVIEW_WIDTH:
+                preview = frame
+            else:
+                preview = cv2.resize(
+                    frame,
+                    (PREVIEW_WIDTH, round(height * PREVIEW_WIDTH / width)),
+                    interpolation=cv2.INTER_AREA,
+                )
+                preview.setflags(write=False)
+            self._preview_source = frame
+            self._preview = preview
+            return preview
+    
+    def get_gray_preview(self, frame: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """
+        Get the preview of ``frame`` converted to grayscale, read-only. Shared
+        like get_preview, so services analysing the same frame convert it once.
+        """
+        preview = self.get_preview(frame)
+        if preview is None:
+            return None
+        with self._preview_lock:
+            if preview is not self._gray_source:
+                gray = cv2.cvtColor(preview, cv2.COLOR_BGR2GRAY)
+                gray.setflags(write=False)
+                self._gray_source = preview
+                self._gray = gray
+            return self._gray
+        
+    def add_viewer(self):
+        """Register a live-stream viewer (keeps full-rate frame retrieval active)"""
+        self._viewers += 1
+        
+    def remove_viewer(self):
+        """Unregister a live-stream viewer"""
+        self._viewers = max(0, self._viewers - 1)
         
     def subscribe(self, callback: Callable):
         """Subscribe to frame updates"""
@@ -184,7 +454,9 @@ class CameraManager:
         """Update RTSP URL and reconnect"""
         logger.info(f"Updating RTSP URL to {new_url}")
         self.rtsp_url = new_url
+        self._gst_pipeline = self._build_gst_pipeline(new_url)
         # Release current capture — the thread will auto-reconnect with the new URL
+        self._cap_open = False
         if self.cap:
             try:
                 self.cap.release()
@@ -194,11 +466,20 @@ class CameraManager:
         
     def get_stats(self) -> dict:
         """Get camera statistics"""
-        is_connected = self.cap is not None and self.cap.isOpened()
+        is_connected = self._cap_open
+        state = self._state
+        
+        # Reuse the formatted timestamp until the stream has moved on by a second
+        stamp, last_frame_time = self._stats_time
+        if state.mono_ns != stamp and (stamp is None or state.mono_ns - stamp >= STATS_TIME_REFRESH_NS):
+            wall = self._to_wall(state.wall_ns)
+            last_frame_time = wall.isoformat() if wall else None
+            self._stats_time = (state.mono_ns, last_frame_time)
+        
         return {
             "is_connected": is_connected,
             "status_message": "Connected and streaming" if is_connected else "Camera unavailable - check connection and RTSP URL",
-            "frame_count": self.frame_count,
-            "last_frame_time": self.last_frame_time.isoformat() if self.last_frame_time else None,
+            "frame_count": state.count,
+            "last_frame_time": last_frame_time,
             "subscribers": len(self.subscribers)
         }
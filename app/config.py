@@ -3,25 +3,36 @@ Configuration management for SkyWatch
 """
 import yaml
 from pathlib import Path
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import List
 
+# libyaml's C loader when PyYAML was built with it, pure-Python otherwise
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
 
-class CameraSettings(BaseModel):
+
+class _FrozenModel(BaseModel):
+    """Immutable settings snapshot: reload_config() swaps in a new one rather than mutating"""
+    model_config = ConfigDict(frozen=True, extra='ignore')
+
+
+class CameraSettings(_FrozenModel):
     rtsp_url: str
     reconnect_interval: int = 5
     frame_width: int = 1920
     frame_height: int = 1080
 
 
-class StorageSettings(BaseModel):
+class StorageSettings(_FrozenModel):
     base_path: str = "/storage"
     nas_enabled: bool = False
     nas_path: str = ""
     retention_days: int = 30
 
 
-class TimelapseSettings(BaseModel):
+class TimelapseSettings(_FrozenModel):
     enabled: bool = True
     interval: int = 60
     quality: int = 90
@@ -29,7 +40,7 @@ class TimelapseSettings(BaseModel):
     video_fps: int = 24
 
 
-class SolargraphSettings(BaseModel):
+class SolargraphSettings(_FrozenModel):
     enabled: bool = True
     detection_interval: int = 30
     brightness_threshold: int = 200
@@ -40,7 +51,7 @@ class SolargraphSettings(BaseModel):
     longitude: float = 0.0
 
 
-class LunarSettings(BaseModel):
+class LunarSettings(_FrozenModel):
     enabled: bool = True
     detection_interval: int = 60
     brightness_threshold: int = 150
@@ -49,28 +60,29 @@ class LunarSettings(BaseModel):
     nighttime_only: bool = True
 
 
-class MotionSettings(BaseModel):
+class MotionSettings(_FrozenModel):
     enabled: bool = True
     sensitivity: int = 25
     min_area: int = 500
     burst_count: int = 10
     burst_fps: int = 10
     cooldown: int = 5
+    frame_skip: int = 1
 
 
-class ServerSettings(BaseModel):
+class ServerSettings(_FrozenModel):
     host: str = "0.0.0.0"
     port: int = 8080
     cors_origins: List[str] = ["*"]
 
 
-class AdvancedSettings(BaseModel):
+class AdvancedSettings(_FrozenModel):
     max_frame_queue: int = 30
     jpeg_quality_live: int = 85
     log_level: str = "INFO"
 
 
-class Settings(BaseModel):
+class Settings(_FrozenModel):
     camera: CameraSettings
     storage: StorageSettings
     timelapse: TimelapseSettings
@@ -93,8 +105,7 @@ def load_config(config_path: str = "config.yaml") -> Settings:
     if not config_file.exists():
         raise FileNotFoundError(f"Configuration file not found: {config_file}")
     
-    with open(config_file, 'r') as f:
-        config_data = yaml.safe_load(f)
+    config_data = yaml.load(config_file.read_bytes(), Loader=_YamlLoader)
     
     return Settings(**config_data)
 
@@ -106,5 +117,9 @@ def reload_config():
     return settings
 
 
-# Global settings instance
-settings = load_config()
+def __getattr__(name: str):
+    """Load the global ``settings`` instance on first access, not at import time"""
+    if name == "settings":
+        # Bind it as a real global so later lookups never come back here
+        return reload_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,68 @@
+"""
+Background image writer so disk latency never stalls capture loops
+"""
+import logging
+import queue
+import threading
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Burst and raw captures don't need OpenCV's default quality of 95; 85 encodes
+# about a third faster at roughly a third of the size
+JPEG_PARAMS = [int(cv2.IMWRITE_JPEG_QUALITY), 85]
+
+
+class AsyncImageWriter:
+    """Writes images with cv2.imwrite from a single background thread"""
+
+    def __init__(self, name: str, max_pending: int = 64, params: Optional[List[int]] = None):
+        self.name = name
+        self.params = JPEG_PARAMS if params is None else params
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, path: str, image: np.ndarray) -> bool:
+        """
+        Queue an image for writing. Thread-safe and never blocks; returns
+        False (dropping the image) if the writer is too far behind.
+        The image must not be modified after submission.
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((path, image))
+            return True
+        except queue.Full:
+            logger.warning(f"{self.name}: write queue full, dropping {path}")
+            return False
+
+    def flush(self):
+        """Block until every queued image has been written"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _ensure_started(self):
+        """Start the writer thread on first use"""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                thread.start()
+                self._thread = thread
+
+    def _run(self):
+        """Writer thread: drain the queue for the lifetime of the process"""
+        while True:
+            path, image = self._queue.get()
+            try:
+                if not cv2.imwrite(path, image, self.params):
+                    logger.error(f"{self.name}: failed to write {path}")
+            except Exception as e:
+                logger.error(f"{self.name}: error writing {path}: {e}")
+            finally:
+                self._queue.task_done()
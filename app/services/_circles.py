@@ -0,0 +1,48 @@
+"""
+Circle geometry helpers shared by the sun and moon detectors
+"""
+from functools import lru_cache
+from typing import Optional
+
+import cv2
+import numpy as np
+
+
+def circle_bbox(x: int, y: int, r: int, h: int, w: int) -> tuple:
+    """Bounding box (y0, y1, x0, x1) of a circle, clipped to an h x w image"""
+    return max(0, y - r), min(h, y + r + 1), max(0, x - r), min(w, x + r + 1)
+
+
+@lru_cache(maxsize=64)
+def _disc_template(extent: int, r: int, inner: int) -> np.ndarray:
+    """Read-only disc (or ring) mask centred in a (2 * extent + 1) square"""
+    dy, dx = np.ogrid[-extent:extent + 1, -extent:extent + 1]
+    dist2 = dy * dy + dx * dx
+    mask = dist2 <= r * r
+    if inner:
+        mask &= dist2 > inner * inner
+    mask.setflags(write=False)
+    return mask
+
+
+def disc_mask(bbox: tuple, x: int, y: int, r: int, inner: int = 0,
+              extent: Optional[int] = None) -> np.ndarray:
+    """
+    Boolean mask of the disc (or ring outside ``inner``) over ``bbox`` only.
+    ``bbox`` is circle_bbox(x, y, extent, ...), with extent defaulting to r.
+    The sun and moon radii barely change between detections, so the mask is
+    a read-only view of a cached template rather than rasterised per call
+    """
+    if extent is None:
+        extent = r
+    y0, y1, x0, x1 = bbox
+    oy, ox = y - extent, x - extent
+    return _disc_template(extent, r, inner)[y0 - oy:y1 - oy, x0 - ox:x1 - ox]
+
+
+def disc_mean(image: np.ndarray, x: int, y: int, r: int, inner: int = 0) -> float:
+    """Mean of a single-channel ``image`` over the disc (or ring), without gathering pixels"""
+    bbox = circle_bbox(x, y, r, image.shape[0], image.shape[1])
+    y0, y1, x0, x1 = bbox
+    mask = disc_mask(bbox, x, y, r, inner)
+    return cv2.mean(image[y0:y1, x0:x1], mask=mask.view(np.uint8))[0]
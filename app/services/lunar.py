@@ -6,14 +6,30 @@ import logging
 import cv2
 import numpy as np
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
 from concurrent.futures import ThreadPoolExecutor
+from app.services._async_writer import AsyncImageWriter
+from app.services._filters import gaussian_blur
+from app.services._circles import circle_bbox, disc_mask, disc_mean
 
 logger = logging.getLogger(__name__)
 
 # Thread pool for CPU-heavy CV operations
 _cv_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lunar-cv")
 
+# Raw captures are written in the background so disk latency never delays detection
+_image_writer = AsyncImageWriter("lunar-writer")
+
+# Seconds between composite saves; it is also saved on stop and before being served
+COMPOSITE_FLUSH_INTERVAL = 30
+
+# Grey levels a 16x16 thumbnail cell must change by before a scene that produced
+# no detection is searched again; a minimum-size disc appearing moves its cell by more
+SCENE_CHANGE_THRESHOLD = 2
+
+# Longest single sleep outside nighttime hours, so clock/DST changes are picked up
+INACTIVE_MAX_SLEEP = 3600
+
 
 class LunarService:
     """Service for capturing and compositing moon positions"""
@@ -23,7 +39,10 @@ class LunarService:
         self.settings = settings
         self.is_running = False
         self.task = None
+        self._flush_task = None
+        self._wake = None  # Set on settings changes to cut long sleeps short
         self.detection_count = 0
+        self.last_frame_count = -1  # Skip frames already analysed
         
         # Setup storage
         self.base_path = Path(settings.storage.base_path) / "lunar"
@@ -32,10 +51,16 @@ class LunarService:
         
         self.composite_path = self.base_path / "composite.jpg"
         self.composite_image = None
+        # Tracked on write/reset so status polling doesn't stat() the file
+        self._composite_exists = self.composite_path.exists()
+        self._unsaved_updates = 0
+        self._blur_buf = None  # Reused detection blur output
+        self._miss_thumb = None  # Thumbnail of the last frame searched without a detection
         
     async def start(self):
         """Start lunar service"""
         self.is_running = True
+        self._wake = asyncio.Event()
         
         # Load existing composite if available
         if self.composite_path.exists():
@@ -43,25 +68,32 @@ class LunarService:
             logger.info("Loaded existing lunar composite")
         
         self.task = asyncio.create_task(self._capture_loop())
+        self._flush_task = asyncio.create_task(self._periodic_flush())
         logger.info("Lunar service started")
         
     async def stop(self):
         """Stop lunar service"""
         self.is_running = False
-        if self.task:
-            self.task.cancel()
-            try:
-                await self.task
-            except asyncio.CancelledError:
-                pass
+        for task in (self.task, self._flush_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        await self.save_composite()
+        await asyncio.get_running_loop().run_in_executor(None, _image_writer.flush)
         logger.info("Lunar service stopped")
     
     def update_settings(self, new_settings):
         """Update settings without restart"""
         old_interval = self.settings.lunar.detection_interval
         self.settings = new_settings
+        self._miss_thumb = None  # Thresholds may have changed
         if old_interval != new_settings.lunar.detection_interval:
             logger.info(f"Lunar detection interval updated: {old_interval}s -> {new_settings.lunar.detection_interval}s")
+        if self._wake is not None:
+            self._wake.set()
         
     async def _capture_loop(self):
         """Main capture loop"""
@@ -69,16 +101,27 @@ class LunarService:
             try:
                 if self._is_nighttime():
                     await self._detect_and_capture_moon()
+                    delay = self.settings.lunar.detection_interval
                 else:
-                    logger.debug("Outside nighttime hours, skipping moon detection")
+                    # Sleep until nightfall instead of waking every interval
+                    delay = min(self._seconds_until_nighttime(), INACTIVE_MAX_SLEEP)
+                    logger.debug(f"Outside nighttime hours, skipping moon detection for {delay:.0f}s")
                     
-                await asyncio.sleep(self.settings.lunar.detection_interval)
+                await self._sleep(delay)
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 logger.error(f"Error in lunar capture: {e}")
                 await asyncio.sleep(5)
                 
+    async def _sleep(self, delay: float):
+        """Sleep for ``delay`` seconds, waking early if settings change"""
+        self._wake.clear()
+        try:
+            await asyncio.wait_for(self._wake.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+    
     def _is_nighttime(self) -> bool:
         """Check if current time is nighttime"""
         if not self.settings.lunar.nighttime_only:
@@ -87,10 +130,18 @@ class LunarService:
         # Simple nighttime check: 8 PM to 6 AM
         current_hour = datetime.now().hour
         return current_hour >= 20 or current_hour <= 6
+    
+    def _seconds_until_nighttime(self) -> float:
+        """Seconds until the next nighttime window opens (called outside it)"""
+        now = datetime.now()
+        start = now.replace(hour=20, minute=0, second=0, microsecond=0)
+        if start <= now:
+            start += timedelta(days=1)
+        return max(1.0, (start - now).total_seconds())
         
     async def _detect_and_capture_moon(self):
         """Detect moon in frame and capture if found"""
-        frame = self.camera.get_frame()
+        self.last_frame_count, frame = self.camera.get_new_frame(self.last_frame_count)
         if frame is None:
             return
         
@@ -106,41 +157,58 @@ class LunarService:
     def _find_moon_sync(self, frame):
         """Find moon in frame using HoughCircles (runs in thread pool)"""
         try:
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            # Detect on the camera's shared downscaled grayscale copy: geometry parameters
+            # (and the vote threshold, which grows with the perimeter) scale down
+            # with it and the winner is mapped back to full resolution
+            gray = self.camera.get_gray_preview(frame)
+            scale = gray.shape[1] / frame.shape[1]
+            kernel = max(3, int(9 * scale) | 1)
+            
+            # Overcast or moonless: nothing bright enough, skip blur and Hough
+            if gray.max() < self.settings.lunar.brightness_threshold:
+                return None
+            
+            # A scene that hasn't changed since the last miss is still a miss:
+            # skip blur and Hough while no 16x16 cell moved by SCENE_CHANGE_THRESHOLD
+            thumb = cv2.resize(gray, (16, 16), interpolation=cv2.INTER_AREA).astype(np.int16)
+            if (self._miss_thumb is not None
+                    and np.abs(thumb - self._miss_thumb).max() < SCENE_CHANGE_THRESHOLD):
+                return None
             
             # Apply Gaussian blur to reduce noise
-            blurred = cv2.GaussianBlur(gray, (9, 9), 2)
+            if self._blur_buf is None or self._blur_buf.shape != gray.shape:
+                self._blur_buf = np.empty_like(gray)
+            blurred = gaussian_blur(gray, kernel, 2 * scale, dst=self._blur_buf)
             
             # Find circles (potential moon)
             circles = cv2.HoughCircles(
                 blurred,
                 cv2.HOUGH_GRADIENT,
                 dp=1,
-                minDist=100,
+                minDist=100 * scale,
                 param1=50,
-                param2=30,
-                minRadius=self.settings.lunar.min_radius,
-                maxRadius=self.settings.lunar.max_radius
+                param2=30 * scale,
+                minRadius=max(1, round(self.settings.lunar.min_radius * scale)),
+                maxRadius=max(1, round(self.settings.lunar.max_radius * scale))
             )
             
             if circles is None or len(circles[0]) == 0:
+                self._miss_thumb = thumb
                 return None
             
             # Take the brightest circle
-            circles = np.uint16(np.around(circles))
             best_circle = None
             max_brightness = 0
             
-            for circle in circles[0]:
-                x, y, r = circle
-                mask = np.zeros_like(gray)
-                cv2.circle(mask, (x, y), r, 255, -1)
-                mean_brightness = cv2.mean(gray, mask=mask)[0]
+            for circle in circles[0].tolist():
+                x, y, r = (round(v) for v in circle)
+                mean_brightness = disc_mean(gray, x, y, r)
                 
                 if mean_brightness > max_brightness:
                     max_brightness = mean_brightness
-                    best_circle = (int(x), int(y), int(r))
+                    best_circle = (round(x / scale), round(y / scale), round(r / scale))
             
+            self._miss_thumb = thumb if best_circle is None else None
             return best_circle
         except Exception as e:
             logger.error(f"Error in moon detection: {e}")
@@ -155,11 +223,8 @@ class LunarService:
         filename = now.strftime("%Y-%m-%d_%H-%M-%S.jpg")
         filepath = self.raw_path / filename
         
-        debug_frame = frame.copy()
-        cv2.circle(debug_frame, (x, y), r, (0, 255, 255), 2)
-        
         loop = asyncio.get_running_loop()
-        await loop.run_in_executor(_cv_executor, cv2.imwrite, str(filepath), debug_frame)
+        await loop.run_in_executor(_cv_executor, self._save_raw_sync, str(filepath), frame, circle_info)
         
         self.detection_count += 1
         logger.info(f"Moon detected and captured: {filename} at ({x}, {y}) radius {r}")
@@ -167,27 +232,68 @@ class LunarService:
         # Update composite
         await self._update_composite(frame, circle_info)
         
+    def _save_raw_sync(self, filepath: str, frame, circle_info) -> bool:
+        """Queue the raw capture with the detected circle drawn on it (runs in thread pool)"""
+        x, y, r = circle_info
+        # Camera frames are shared read-only with the other services and the
+        # composite still needs the clean frame, so annotate one copy per detection
+        debug_frame = frame.copy()
+        cv2.circle(debug_frame, (x, y), r, (0, 255, 255), 2)
+        return _image_writer.submit(filepath, debug_frame)
+        
     async def _update_composite(self, frame, circle_info):
         """Update composite image with new moon position"""
+        loop = asyncio.get_running_loop()
+        if await loop.run_in_executor(_cv_executor, self._update_composite_sync, frame, circle_info):
+            self._composite_exists = True
+        logger.debug("Lunar composite image updated")
+        
+    def _update_composite_sync(self, frame, circle_info) -> bool:
+        """Blend the moon region into the composite (runs in thread pool)"""
         if self.composite_image is None:
             # Initialize composite with first frame (darkened)
-            self.composite_image = (frame * 0.2).astype(np.uint8)
+            self.composite_image = cv2.convertScaleAbs(frame, alpha=0.2)
         
-        # Extract moon region
+        # Only the moon's bounding box can change
         x, y, r = circle_info
-        mask = np.zeros(frame.shape[:2], dtype=np.uint8)
-        cv2.circle(mask, (x, y), r, 255, -1)
+        bbox = circle_bbox(x, y, r, frame.shape[0], frame.shape[1])
+        y0, y1, x0, x1 = bbox
+        mask = disc_mask(bbox, x, y, r)
         
-        # Blend moon into composite using maximum intensity
-        moon_region = cv2.bitwise_and(frame, frame, mask=mask)
+        # Use maximum pixel values to accumulate moon trails, in place
+        patch = self.composite_image[y0:y1, x0:x1]
+        np.maximum(patch, frame[y0:y1, x0:x1], out=patch, where=mask[..., None])
         
-        # Use maximum pixel values to accumulate moon trails
-        self.composite_image = np.maximum(self.composite_image, moon_region)
-        
-        # Save composite in executor
+        # Saved by the periodic flush; only the very first composite is written now
+        self._unsaved_updates += 1
+        if self._composite_exists:
+            return False
+        return self._save_composite_sync()
+    
+    async def _periodic_flush(self):
+        """Save unsaved composite updates every COMPOSITE_FLUSH_INTERVAL seconds"""
+        while self.is_running:
+            await asyncio.sleep(COMPOSITE_FLUSH_INTERVAL)
+            try:
+                await self.save_composite()
+            except Exception as e:
+                logger.error(f"Error saving lunar composite: {e}")
+    
+    async def save_composite(self):
+        """Write any unsaved composite updates to disk"""
         loop = asyncio.get_running_loop()
-        await loop.run_in_executor(_cv_executor, cv2.imwrite, str(self.composite_path), self.composite_image)
-        logger.debug("Lunar composite image updated")
+        if await loop.run_in_executor(_cv_executor, self._save_composite_sync):
+            self._composite_exists = True
+    
+    def _save_composite_sync(self) -> bool:
+        """Write the composite if it has unsaved updates (runs in thread pool)"""
+        if self.composite_image is None or not self._unsaved_updates:
+            return False
+        if not cv2.imwrite(str(self.composite_path), self.composite_image):
+            logger.error(f"Failed to write lunar composite to {self.composite_path}")
+            return False
+        self._unsaved_updates = 0
+        return True
         
     def get_stats(self) -> dict:
         """Get service statistics"""
@@ -196,7 +302,7 @@ class LunarService:
             "is_running": self.is_running,
             "detection_count": self.detection_count,
             "interval": self.settings.lunar.detection_interval,
-            "composite_exists": self.composite_path.exists(),
+            "composite_exists": self._composite_exists,
             "storage_path": str(self.base_path)
         }
         
@@ -204,10 +310,15 @@ class LunarService:
         """Get path to composite image"""
         return self.composite_path
     
+    def has_composite(self) -> bool:
+        """Whether the composite image has been written to disk"""
+        return self._composite_exists
+    
     def reset_composite(self):
         """Reset/clear the composite image"""
         self.composite_image = None
-        if self.composite_path.exists():
-            self.composite_path.unlink()
+        self.composite_path.unlink(missing_ok=True)
+        self._composite_exists = False
+        self._unsaved_updates = 0
         self.detection_count = 0
         logger.info("Lunar composite reset")
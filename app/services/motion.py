@@ -3,18 +3,25 @@ Motion detection service for capturing wildlife/events
 """
 import asyncio
 import logging
+import os
 import cv2
 import numpy as np
 from pathlib import Path
 from datetime import datetime
 import time
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
+from app.services._async_writer import AsyncImageWriter
+from app.services._filters import gaussian_blur
 
 logger = logging.getLogger(__name__)
 
 # Thread pool for CPU-heavy CV operations
 _cv_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="motion-cv")
 
+# Burst frames are written in the background so the burst keeps its pacing
+_image_writer = AsyncImageWriter("motion-writer")
+
 
 class MotionDetectionService:
     """Service for detecting motion and capturing burst images"""
@@ -26,9 +33,15 @@ class MotionDetectionService:
         self.task = None
         self.detection_count = 0
         
-        # Motion detection state
-        self.previous_frame = None
+        # Motion detection state: the last 2k+1 blurred frames (k = frame_skip)
+        # and the BGR frames they came from
+        self._history: deque = deque()
+        self._frames: deque = deque()
+        self._spare = None  # Evicted history buffer, reused for the next blur
         self.last_detection_time = 0
+        # Reused per-tick working buffers, keyed by preview shape (motion-cv thread only)
+        self._buffers = None
+        self.last_frame_count = -1  # Skip frames already analysed
         
         # Setup storage
         self.base_path = Path(settings.storage.base_path) / "motion"
@@ -49,6 +62,7 @@ class MotionDetectionService:
                 await self.task
             except asyncio.CancelledError:
                 pass
+        await asyncio.get_running_loop().run_in_executor(None, _image_writer.flush)
         logger.info("Motion detection service stopped")
     
     def update_settings(self, new_settings):
@@ -72,55 +86,93 @@ class MotionDetectionService:
                 
     async def _detect_motion(self):
         """Detect motion in current frame"""
-        frame = self.camera.get_frame()
+        self.last_frame_count, frame = self.camera.get_new_frame(self.last_frame_count)
         if frame is None:
             return
         
         # Run heavy CV operations off the event loop
         loop = asyncio.get_running_loop()
-        motion_detected = await loop.run_in_executor(
+        trigger_frame = await loop.run_in_executor(
             _cv_executor, self._process_frame_sync, frame
         )
         
-        if motion_detected:
+        if trigger_frame is not None:
             current_time = time.time()
             if current_time - self.last_detection_time >= self.settings.motion.cooldown:
-                await self._capture_burst(frame)
+                await self._capture_burst(trigger_frame)
                 self.last_detection_time = current_time
     
-    def _process_frame_sync(self, frame) -> bool:
-        """Process frame for motion detection (runs in thread pool)"""
+    def _process_frame_sync(self, frame):
+        """Process frame for motion detection (runs in thread pool).
+        
+        Returns the BGR frame the motion was found in (the middle of the
+        history, k ticks back), or None.
+        """
         try:
-            # Convert to grayscale and blur
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            gray = cv2.GaussianBlur(gray, (21, 21), 0)
+            # Work on the camera's shared downscaled grayscale copy; scale the blur
+            # kernel, dilation and min_area so detection behaves as at full resolution
+            gray = self.camera.get_gray_preview(frame)
+            scale = gray.shape[1] / frame.shape[1]
+            kernel = max(3, int(21 * scale) | 1)
+            dilate_iterations = max(1, round(2 * scale))
             
-            # Initialize previous frame
-            if self.previous_frame is None:
-                self.previous_frame = gray
-                return False
-                
-            # Compute difference
-            frame_delta = cv2.absdiff(self.previous_frame, gray)
-            thresh = cv2.threshold(frame_delta, self.settings.motion.sensitivity, 255, cv2.THRESH_BINARY)[1]
+            # (Re)allocate the working buffers on the first frame, a resolution
+            # change or a new frame_skip; either way the history starts over
+            shape = gray.shape
+            gap = self.settings.motion.frame_skip
+            if (self._buffers is None or self._buffers["delta"].shape != shape
+                    or self._history.maxlen != 2 * gap + 1):
+                self._buffers = {
+                    name: np.empty(shape, np.uint8)
+                    for name in ("delta", "d01", "d12", "d02")
+                }
+                self._history = deque(maxlen=2 * gap + 1)
+                self._frames = deque(maxlen=2 * gap + 1)
+                self._spare = None
+            buffers = self._buffers
+            history = self._history
             
-            # Dilate to fill in holes
-            thresh = cv2.dilate(thresh, None, iterations=2)
+            # Blur the shared grayscale preview into a recycled history buffer
+            blur = self._spare if self._spare is not None else np.empty(shape, np.uint8)
+            self._spare = None
+            gaussian_blur(gray, kernel, 0, dst=blur)
+            if len(history) == history.maxlen:
+                self._spare = history.popleft()
+            history.append(blur)
+            self._frames.append(frame)
             
-            # Find contours
-            contours, _ = cv2.findContours(thresh.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            # Wait until the history holds t-k, t and t+k
+            if len(history) < history.maxlen:
+                return None
+            earliest, middle, latest = history[0], history[gap], history[-1]
             
-            # Update previous frame
-            self.previous_frame = gray
+            # Three-frame difference: changed from t-k to t AND from t to t+k,
+            # but NOT from t-k to t+k. This keeps the object at t and drops the
+            # ghosts of where it was, plus slow global drift (jitter, shadows)
+            sensitivity = self.settings.motion.sensitivity
+            for name, a, b in (("d01", earliest, middle), ("d12", middle, latest), ("d02", earliest, latest)):
+                cv2.absdiff(a, b, dst=buffers["delta"])
+                cv2.threshold(buffers["delta"], sensitivity, 255, cv2.THRESH_BINARY, dst=buffers[name])
+            thresh = buffers["d01"]
+            cv2.bitwise_and(thresh, buffers["d12"], dst=thresh)
+            cv2.bitwise_not(buffers["d02"], dst=buffers["d02"])
+            cv2.bitwise_and(thresh, buffers["d02"], dst=thresh)
+            
+            # Dilate to fill in holes (in place)
+            cv2.dilate(thresh, None, dst=thresh, iterations=dilate_iterations)
+            
+            # Find contours
+            contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
             
             # Check for significant motion
+            min_area = self.settings.motion.min_area * scale * scale
             for contour in contours:
-                if cv2.contourArea(contour) >= self.settings.motion.min_area:
-                    return True
-            return False
+                if cv2.contourArea(contour) >= min_area:
+                    return self._frames[gap]
+            return None
         except Exception as e:
             logger.error(f"Error in motion frame processing: {e}")
-            return False
+            return None
         
     async def _capture_burst(self, trigger_frame):
         """Capture burst of images when motion detected"""
@@ -132,18 +184,17 @@ class MotionDetectionService:
         logger.info(f"Motion detected! Capturing burst to {event_dir.name}")
         
         # Save trigger frame
-        cv2.imwrite(str(event_dir / "trigger.jpg"), trigger_frame)
+        _image_writer.submit(str(event_dir / "trigger.jpg"), trigger_frame)
         
         # Capture burst
-        frame_interval = 1.0 / self.settings.motion.burst_fps
-        for i in range(self.settings.motion.burst_count):
-            frame = self.camera.get_frame()
-            if frame is not None:
-                filename = f"burst_{i:03d}.jpg"
-                cv2.imwrite(str(event_dir / filename), frame)
-            await asyncio.sleep(frame_interval)
+        frames = await self.camera.capture_burst(
+            self.settings.motion.burst_count, self.settings.motion.burst_fps
+        )
+        for i, frame in enumerate(frames):
+            filename = f"burst_{i:03d}.jpg"
+            _image_writer.submit(str(event_dir / filename), frame)
             
-        logger.info(f"Burst capture complete: {self.settings.motion.burst_count} frames")
+        logger.info(f"Burst capture complete: {len(frames)} frames")
         
     def get_stats(self) -> dict:
         """Get service statistics"""
@@ -159,13 +210,19 @@ class MotionDetectionService:
         """Get list of recent motion events"""
         events = []
         if self.base_path.exists():
-            event_dirs = sorted(self.base_path.iterdir(), reverse=True)
+            # scandir hands back names and types without a stat() per entry
+            with os.scandir(self.base_path) as entries:
+                event_dirs = sorted(entries, key=lambda entry: entry.name, reverse=True)
             for event_dir in event_dirs[:limit]:
                 if event_dir.is_dir():
-                    frame_count = len(list(event_dir.glob("burst_*.jpg")))
+                    with os.scandir(event_dir.path) as files:
+                        frame_count = sum(
+                            1 for f in files
+                            if f.name.startswith("burst_") and f.name.endswith(".jpg")
+                        )
                     events.append({
                         "timestamp": event_dir.name,
-                        "path": str(event_dir.relative_to(self.base_path)),
+                        "path": event_dir.name,
                         "frame_count": frame_count
                     })
         return events
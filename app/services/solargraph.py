@@ -3,19 +3,44 @@ Solargraph service for tracking and compositing sun positions
 """
 import asyncio
 import logging
+import math
 import cv2
 import numpy as np
 from pathlib import Path
-from datetime import datetime, time
+from datetime import datetime, time, timedelta
 from astral import LocationInfo
 from astral.sun import sun
 from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from typing import Optional, Tuple
+from app.services._async_writer import AsyncImageWriter
+from app.services._filters import gaussian_blur
+from app.services._circles import circle_bbox, disc_mask
 
 logger = logging.getLogger(__name__)
 
 # Thread pool for CPU-heavy CV operations
 _cv_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="solar-cv")
 
+# Raw captures are written in the background so disk latency never delays detection
+_image_writer = AsyncImageWriter("solar-writer")
+
+# Seconds between composite saves; it is also saved on stop and before being served
+COMPOSITE_FLUSH_INTERVAL = 30
+
+# Grey levels a 16x16 thumbnail cell must change by before a scene that produced
+# no detection is searched again; a minimum-size disc appearing moves its cell by more
+SCENE_CHANGE_THRESHOLD = 2
+
+# Longest single sleep outside daylight hours, so clock/DST changes are picked up
+INACTIVE_MAX_SLEEP = 3600
+
+# The sun moves only a few pixels between detections, so after a Hough fix it is
+# re-found by a local check around its last position; a full search runs again
+# after TRACK_MAX_FRAMES tracked detections or TRACK_MAX_AGE seconds
+TRACK_MAX_FRAMES = 10
+TRACK_MAX_AGE = 300
+
 
 class SolargraphService:
     """Service for capturing and compositing sun positions"""
@@ -25,7 +50,10 @@ class SolargraphService:
         self.settings = settings
         self.is_running = False
         self.task = None
+        self._flush_task = None
+        self._wake = None  # Set on settings changes to cut long sleeps short
         self.detection_count = 0
+        self.last_frame_count = -1  # Skip frames already analysed
         
         # Setup storage
         self.base_path = Path(settings.storage.base_path) / "solargraph"
@@ -34,6 +62,13 @@ class SolargraphService:
         
         self.composite_path = self.base_path / "composite.jpg"
         self.composite_image = None
+        # Tracked on write/reset so status polling doesn't stat() the file
+        self._composite_exists = self.composite_path.exists()
+        self._unsaved_updates = 0
+        self._blur_buf = None  # Reused detection blur output
+        self._miss_thumb = None  # Thumbnail of the last frame searched without a detection
+        self._track = None  # (circle, monotonic time of its Hough fix) to re-find locally
+        self._track_count = 0  # Detections tracked since the last Hough fix
         
         # Setup location for sunrise/sunset
         if settings.solargraph.latitude != 0 or settings.solargraph.longitude != 0:
@@ -43,10 +78,13 @@ class SolargraphService:
             )
         else:
             self.location = None
+        # (date, sunrise, sunset) for the current day; sunrise/sunset change once a day
+        self._sun_cache = None
             
     async def start(self):
         """Start solargraph service"""
         self.is_running = True
+        self._wake = asyncio.Event()
         
         # Load existing composite if available
         if self.composite_path.exists():
@@ -54,29 +92,38 @@ class SolargraphService:
             logger.info("Loaded existing solargraph composite")
         
         self.task = asyncio.create_task(self._capture_loop())
+        self._flush_task = asyncio.create_task(self._periodic_flush())
         logger.info("Solargraph service started")
         
     async def stop(self):
         """Stop solargraph service"""
         self.is_running = False
-        if self.task:
-            self.task.cancel()
-            try:
-                await self.task
-            except asyncio.CancelledError:
-                pass
+        for task in (self.task, self._flush_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        await self.save_composite()
+        await asyncio.get_running_loop().run_in_executor(None, _image_writer.flush)
         logger.info("Solargraph service stopped")
     
     def update_settings(self, new_settings):
         """Update settings without restart"""
         old_interval = self.settings.solargraph.detection_interval
         self.settings = new_settings
+        self._miss_thumb = None  # Thresholds may have changed
+        self._track = None
         if old_interval != new_settings.solargraph.detection_interval:
             logger.info(f"Solargraph detection interval updated: {old_interval}s -> {new_settings.solargraph.detection_interval}s")
         # Update location if coordinates changed
         if new_settings.solargraph.latitude and new_settings.solargraph.longitude:
             self.location = (new_settings.solargraph.latitude, new_settings.solargraph.longitude)
+            self._sun_cache = None
             logger.info(f"Solargraph location updated to: {self.location}")
+        if self._wake is not None:
+            self._wake.set()
         
     async def _capture_loop(self):
         """Main capture loop"""
@@ -84,16 +131,27 @@ class SolargraphService:
             try:
                 if self._is_daytime():
                     await self._detect_and_capture_sun()
+                    delay = self.settings.solargraph.detection_interval
                 else:
-                    logger.debug("Outside daylight hours, skipping sun detection")
+                    # Sleep until daylight instead of waking every interval
+                    delay = min(self._seconds_until_daytime(), INACTIVE_MAX_SLEEP)
+                    logger.debug(f"Outside daylight hours, skipping sun detection for {delay:.0f}s")
                     
-                await asyncio.sleep(self.settings.solargraph.detection_interval)
+                await self._sleep(delay)
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 logger.error(f"Error in solargraph capture: {e}")
                 await asyncio.sleep(5)
                 
+    async def _sleep(self, delay: float):
+        """Sleep for ``delay`` seconds, waking early if settings change"""
+        self._wake.clear()
+        try:
+            await asyncio.wait_for(self._wake.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+    
     def _is_daytime(self) -> bool:
         """Check if current time is during daylight hours"""
         if not self.settings.solargraph.daytime_only:
@@ -105,18 +163,32 @@ class SolargraphService:
             return 6 <= current_hour <= 20
             
         try:
-            s = sun(self.location.observer, date=datetime.now())
-            now = datetime.now().time()
-            sunrise = s["sunrise"].time()
-            sunset = s["sunset"].time()
-            return sunrise <= now <= sunset
+            now = datetime.now()
+            today = now.date()
+            if self._sun_cache is None or self._sun_cache[0] != today:
+                s = sun(self.location.observer, date=now)
+                self._sun_cache = (today, s["sunrise"].time(), s["sunset"].time())
+            _, sunrise, sunset = self._sun_cache
+            return sunrise <= now.time() <= sunset
         except Exception as e:
             logger.error(f"Error calculating daylight hours: {e}")
             return True
+    
+    def _seconds_until_daytime(self) -> float:
+        """Seconds until the next daylight window opens (called outside it)"""
+        now = datetime.now()
+        if self.location is None or self._sun_cache is None:
+            start = now.replace(hour=6, minute=0, second=0, microsecond=0)
+        else:
+            # Tomorrow's sunrise is close enough to today's; capped sleeps correct the rest
+            start = datetime.combine(now.date(), self._sun_cache[1])
+        if start <= now:
+            start += timedelta(days=1)
+        return max(1.0, (start - now).total_seconds())
             
     async def _detect_and_capture_sun(self):
         """Detect sun in frame and capture if found"""
-        frame = self.camera.get_frame()
+        self.last_frame_count, frame = self.camera.get_new_frame(self.last_frame_count)
         if frame is None:
             return
         
@@ -132,96 +204,180 @@ class SolargraphService:
     def _find_sun_sync(self, frame):
         """Find sun in frame using HoughCircles (runs in thread pool)"""
         try:
-            # Convert to grayscale
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            # Detect on the camera's shared downscaled grayscale copy: geometry parameters
+            # (and the vote threshold, which grows with the perimeter) scale down
+            # with it and the winner is mapped back to full resolution
+            gray = self.camera.get_gray_preview(frame)
+            scale = gray.shape[1] / frame.shape[1]
+            kernel = max(3, int(9 * scale) | 1)
+            
+            # Bail out before blur and Hough when no sun-sized patch is bright
+            # enough; a real sun fills most of its disc above the threshold
+            threshold = self.settings.solargraph.brightness_threshold
+            min_pixels = math.pi * (self.settings.solargraph.min_radius * scale) ** 2 / 4
+            if np.count_nonzero(gray > threshold) < min_pixels:
+                self._track = None
+                return None
+            
+            # Cheap O(r^2) re-check around the last fix before a full Hough search
+            tracked = self._track_sun(gray, scale)
+            if tracked is not None:
+                return tracked
+            
+            # A scene that hasn't changed since the last miss is still a miss:
+            # skip blur and Hough while no 16x16 cell moved by SCENE_CHANGE_THRESHOLD
+            thumb = cv2.resize(gray, (16, 16), interpolation=cv2.INTER_AREA).astype(np.int16)
+            if (self._miss_thumb is not None
+                    and np.abs(thumb - self._miss_thumb).max() < SCENE_CHANGE_THRESHOLD):
+                return None
             
             # Apply Gaussian blur to reduce noise
-            blurred = cv2.GaussianBlur(gray, (9, 9), 2)
+            if self._blur_buf is None or self._blur_buf.shape != gray.shape:
+                self._blur_buf = np.empty_like(gray)
+            blurred = gaussian_blur(gray, kernel, 2 * scale, dst=self._blur_buf)
             
             # Find circles (potential sun) with stricter parameters
             circles = cv2.HoughCircles(
                 blurred,
                 cv2.HOUGH_GRADIENT,
                 dp=1,
-                minDist=200,
+                minDist=200 * scale,
                 param1=100,
-                param2=50,
-                minRadius=self.settings.solargraph.min_radius,
-                maxRadius=self.settings.solargraph.max_radius
+                param2=50 * scale,
+                minRadius=max(1, round(self.settings.solargraph.min_radius * scale)),
+                maxRadius=max(1, round(self.settings.solargraph.max_radius * scale))
             )
             
             if circles is None or len(circles[0]) == 0:
+                self._miss_thumb = thumb
                 return None
             
             # Take the brightest circle that meets sun criteria
-            circles = np.uint16(np.around(circles))
+            circles = np.around(circles[0]).astype(int)
+            xs, ys, rs = circles[:, 0], circles[:, 1], circles[:, 2]
+            
+            # Drop edge candidates in one vectorised pass (the validator's first check)
+            h, w = gray.shape
+            margin = 50 * scale
+            keep = (xs >= margin) & (xs <= w - margin) & (ys >= margin) & (ys <= h - margin)
+            
+            # Largest first: a score can't exceed 255 * r / max_radius, so once that
+            # bound falls to the best score so far no remaining candidate can win
+            candidates = circles[keep][np.argsort(-rs[keep], kind="stable")]
             best_circle = None
             max_score = 0
+            max_radius = self.settings.solargraph.max_radius * scale
             
-            for circle in circles[0]:
-                x, y, r = circle
+            for x, y, r in candidates.tolist():
+                if 255 * (r / max_radius) <= max_score:
+                    break
                 
-                if not self._validate_sun_candidate(gray, x, y, r):
+                # Cheap 3x3 centre gate before any masked statistics: spurious
+                # circles on clouds or edges rarely have a bright centre
+                if gray[y - 1:y + 2, x - 1:x + 2].mean() < threshold - 30:
                     continue
                 
-                mask = np.zeros_like(gray)
-                cv2.circle(mask, (x, y), r, 255, -1)
-                mean_brightness = cv2.mean(gray, mask=mask)[0]
+                ok, mean_brightness = self._validate_sun_candidate(gray, x, y, r, scale)
+                if not ok:
+                    continue
                 
-                score = mean_brightness * (r / self.settings.solargraph.max_radius)
+                score = mean_brightness * (r / max_radius)
                 
-                if score > max_score and mean_brightness > self.settings.solargraph.brightness_threshold:
+                if score > max_score and mean_brightness > threshold:
                     max_score = score
-                    best_circle = (int(x), int(y), int(r))
+                    best_circle = (round(x / scale), round(y / scale), round(r / scale))
             
+            self._miss_thumb = thumb if best_circle is None else None
+            if best_circle is not None:
+                self._track = (best_circle, monotonic())
+                self._track_count = 0
             return best_circle
         except Exception as e:
             logger.error(f"Error in sun detection: {e}")
             return None
     
-    def _validate_sun_candidate(self, gray, x, y, r) -> bool:
-        """Validate if a circle could be the sun"""
+    def _track_sun(self, gray, scale: float) -> Optional[Tuple[int, int, int]]:
+        """
+        Re-find the last detected sun in a 3r x 3r window around it, re-centred on
+        the window's bright pixels. Returns None when a full search is needed.
+        """
+        if self._track is None:
+            return None
+        (x, y, r), found_at = self._track
+        if self._track_count >= TRACK_MAX_FRAMES or monotonic() - found_at > TRACK_MAX_AGE:
+            self._track = None
+            return None
+        
+        x, y, r = round(x * scale), round(y * scale), max(1, round(r * scale))
+        h, w = gray.shape
+        y0, y1, x0, x1 = circle_bbox(x, y, int(r * 1.5), h, w)
+        threshold = self.settings.solargraph.brightness_threshold
+        _, bright = cv2.threshold(gray[y0:y1, x0:x1], threshold, 255, cv2.THRESH_BINARY)
+        moments = cv2.moments(bright, binaryImage=True)
+        
+        # Less than half a disc still bright: it moved away, set or was occluded
+        if moments["m00"] < math.pi * r * r / 2:
+            self._track = None
+            return None
+        
+        x = x0 + round(moments["m10"] / moments["m00"])
+        y = y0 + round(moments["m01"] / moments["m00"])
+        ok, mean_brightness = self._validate_sun_candidate(gray, x, y, r, scale)
+        if not ok or mean_brightness <= threshold:
+            self._track = None
+            return None
+        
+        circle = (round(x / scale), round(y / scale), round(r / scale))
+        self._track = (circle, found_at)
+        self._track_count += 1
+        return circle
+    
+    def _validate_sun_candidate(self, gray, x, y, r, scale: float = 1.0) -> Tuple[bool, float]:
+        """
+        Validate if a circle could be the sun (``gray`` is the frame at ``scale``).
+        Returns ``(ok, mean_brightness)`` so callers needn't measure the disc again.
+        """
         h, w = gray.shape
         
         # Sun shouldn't be at the very edge of the frame
-        margin = 50
+        margin = 50 * scale
         if x < margin or x > w - margin or y < margin or y > h - margin:
-            return False
+            return False, 0.0
         
-        # Check if the circle area is uniformly bright (not just a small bright spot)
-        mask = np.zeros_like(gray)
-        cv2.circle(mask, (x, y), r, 255, -1)
+        # One patch covers both the disc and the glow ring around it; the masked
+        # statistics are computed in place, without gathering the pixels
+        outer_r = int(r * 1.5)
+        bbox = circle_bbox(x, y, outer_r, h, w)
+        y0, y1, x0, x1 = bbox
+        patch = gray[y0:y1, x0:x1]
+        inside = disc_mask(bbox, x, y, r, extent=outer_r)
         
-        # Get pixel values in the circle
-        circle_pixels = gray[mask > 0]
-        if len(circle_pixels) == 0:
-            return False
+        # Check if the circle area is uniformly bright (not just a small bright spot)
+        if not inside.any():
+            return False, 0.0
         
-        mean_brightness = np.mean(circle_pixels)
-        std_brightness = np.std(circle_pixels)
+        mean, std = cv2.meanStdDev(patch, mask=inside.view(np.uint8))
+        mean_brightness = mean[0, 0]
+        std_brightness = std[0, 0]
         
         # Sun should be very bright
         if mean_brightness < self.settings.solargraph.brightness_threshold:
-            return False
+            return False, mean_brightness
         
         # Sun should be relatively uniform (not a random bright spot)
         # Low standard deviation means uniform brightness
         if std_brightness > 50:  # Too much variation
-            return False
+            return False, mean_brightness
         
         # Check the area around the circle - sun should have a glow/gradient
-        outer_mask = np.zeros_like(gray)
-        cv2.circle(outer_mask, (x, y), int(r * 1.5), 255, -1)
-        cv2.circle(outer_mask, (x, y), r, 0, -1)  # Remove inner circle
-        
-        outer_pixels = gray[outer_mask > 0]
-        if len(outer_pixels) > 0:
-            outer_brightness = np.mean(outer_pixels)
+        ring = disc_mask(bbox, x, y, outer_r, inner=r)
+        if ring.any():
+            outer_brightness = cv2.mean(patch, mask=ring.view(np.uint8))[0]
             # There should be a significant drop in brightness outside the sun
             if mean_brightness - outer_brightness < 30:
-                return False
+                return False, mean_brightness
         
-        return True
+        return True, mean_brightness
                 
     async def _capture_sun(self, frame, circle_info):
         """Capture sun and update composite"""
@@ -232,11 +388,8 @@ class SolargraphService:
         filename = now.strftime("%Y-%m-%d_%H-%M-%S.jpg")
         filepath = self.raw_path / filename
         
-        debug_frame = frame.copy()
-        cv2.circle(debug_frame, (x, y), r, (0, 255, 0), 2)
-        
         loop = asyncio.get_running_loop()
-        await loop.run_in_executor(_cv_executor, cv2.imwrite, str(filepath), debug_frame)
+        await loop.run_in_executor(_cv_executor, self._save_raw_sync, str(filepath), frame, circle_info)
         
         self.detection_count += 1
         logger.info(f"Sun detected and captured: {filename} at ({x}, {y}) radius {r}")
@@ -244,27 +397,68 @@ class SolargraphService:
         # Update composite
         await self._update_composite(frame, circle_info)
         
+    def _save_raw_sync(self, filepath: str, frame, circle_info) -> bool:
+        """Queue the raw capture with the detected circle drawn on it (runs in thread pool)"""
+        x, y, r = circle_info
+        # Camera frames are shared read-only with the other services and the
+        # composite still needs the clean frame, so annotate one copy per detection
+        debug_frame = frame.copy()
+        cv2.circle(debug_frame, (x, y), r, (0, 255, 0), 2)
+        return _image_writer.submit(filepath, debug_frame)
+        
     async def _update_composite(self, frame, circle_info):
         """Update composite image with new sun position"""
+        loop = asyncio.get_running_loop()
+        if await loop.run_in_executor(_cv_executor, self._update_composite_sync, frame, circle_info):
+            self._composite_exists = True
+        logger.debug("Composite image updated")
+        
+    def _update_composite_sync(self, frame, circle_info) -> bool:
+        """Blend the sun region into the composite (runs in thread pool)"""
         if self.composite_image is None:
             # Initialize composite with first frame (darkened)
-            self.composite_image = (frame * 0.3).astype(np.uint8)
+            self.composite_image = cv2.convertScaleAbs(frame, alpha=0.3)
         
-        # Extract sun region
+        # Only the sun's bounding box can change
         x, y, r = circle_info
-        mask = np.zeros(frame.shape[:2], dtype=np.uint8)
-        cv2.circle(mask, (x, y), r, 255, -1)
-        
-        # Blend sun into composite using maximum intensity
-        sun_region = cv2.bitwise_and(frame, frame, mask=mask)
+        bbox = circle_bbox(x, y, r, frame.shape[0], frame.shape[1])
+        y0, y1, x0, x1 = bbox
+        mask = disc_mask(bbox, x, y, r)
         
-        # Use maximum pixel values to accumulate sun trails
-        self.composite_image = np.maximum(self.composite_image, sun_region)
+        # Use maximum pixel values to accumulate sun trails, in place
+        patch = self.composite_image[y0:y1, x0:x1]
+        np.maximum(patch, frame[y0:y1, x0:x1], out=patch, where=mask[..., None])
         
-        # Save composite in executor
+        # Saved by the periodic flush; only the very first composite is written now
+        self._unsaved_updates += 1
+        if self._composite_exists:
+            return False
+        return self._save_composite_sync()
+    
+    async def _periodic_flush(self):
+        """Save unsaved composite updates every COMPOSITE_FLUSH_INTERVAL seconds"""
+        while self.is_running:
+            await asyncio.sleep(COMPOSITE_FLUSH_INTERVAL)
+            try:
+                await self.save_composite()
+            except Exception as e:
+                logger.error(f"Error saving solargraph composite: {e}")
+    
+    async def save_composite(self):
+        """Write any unsaved composite updates to disk"""
         loop = asyncio.get_running_loop()
-        await loop.run_in_executor(_cv_executor, cv2.imwrite, str(self.composite_path), self.composite_image)
-        logger.debug("Composite image updated")
+        if await loop.run_in_executor(_cv_executor, self._save_composite_sync):
+            self._composite_exists = True
+    
+    def _save_composite_sync(self) -> bool:
+        """Write the composite if it has unsaved updates (runs in thread pool)"""
+        if self.composite_image is None or not self._unsaved_updates:
+            return False
+        if not cv2.imwrite(str(self.composite_path), self.composite_image):
+            logger.error(f"Failed to write solargraph composite to {self.composite_path}")
+            return False
+        self._unsaved_updates = 0
+        return True
         
     def get_stats(self) -> dict:
         """Get service statistics"""
@@ -273,7 +467,7 @@ class SolargraphService:
             "is_running": self.is_running,
             "detection_count": self.detection_count,
             "interval": self.settings.solargraph.detection_interval,
-            "composite_exists": self.composite_path.exists(),
+            "composite_exists": self._composite_exists,
             "storage_path": str(self.base_path)
         }
         
@@ -281,10 +475,15 @@ class SolargraphService:
         """Get path to composite image"""
         return self.composite_path
     
+    def has_composite(self) -> bool:
+        """Whether the composite image has been written to disk"""
+        return self._composite_exists
+    
     def reset_composite(self):
         """Reset/clear the composite image"""
         self.composite_image = None
-        if self.composite_path.exists():
-            self.composite_path.unlink()
+        self.composite_path.unlink(missing_ok=True)
+        self._composite_exists = False
+        self._unsaved_updates = 0
         self.detection_count = 0
         logger.info("Solargraph composite reset")
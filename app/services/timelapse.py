@@ -1,24 +1,48 @@
 """
-Timelapse capture service with incremental video compilation
+Timelapse capture service with continuous video encoding
 """
 import asyncio
 import logging
-import cv2
+import os
+import re
 from pathlib import Path
 from datetime import datetime
 import numpy as np
 import tempfile
 import shutil
-from concurrent.futures import ThreadPoolExecutor
-
-# Shared thread pool for blocking I/O (cv2.imwrite, file ops)
-_io_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="timelapse-io")
 
 logger = logging.getLogger(__name__)
 
+# Hardware H.264 encoders, tried in order: Raspberry Pi, NVIDIA/Jetson, Intel/AMD.
+# libx264 is the fallback when none of them can actually encode here
+HW_ENCODERS = ("h264_v4l2m2m", "h264_nvenc", "h264_vaapi")
+VAAPI_DEVICE = "/dev/dri/renderD128"
+
+# Daily videos are named YYYY-MM-DD.mp4; anything else in the directory is not a date
+_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+# Seconds a frame write may wait on the encoder before it is considered hung
+ENCODER_WRITE_TIMEOUT = 30
+
+# Seconds a day-close re-encode (daily video plus side files) may take
+MERGE_TIMEOUT = 3600
+
+
+def _codec_args(codec: str, crf: int) -> tuple:
+    """(input, output) ffmpeg arguments for an H.264 encoder at a CRF-like quality"""
+    if codec == "h264_v4l2m2m":
+        return [], ['-pix_fmt', 'yuv420p', '-c:v', codec, '-b:v', '4M']
+    if codec == "h264_nvenc":
+        return [], ['-pix_fmt', 'yuv420p', '-c:v', codec, '-preset', 'p1', '-cq', str(crf)]
+    if codec == "h264_vaapi":
+        return (['-vaapi_device', VAAPI_DEVICE],
+                ['-vf', 'format=nv12,hwupload', '-c:v', codec, '-qp', str(crf)])
+    # Fast encoding for real-time
+    return [], ['-pix_fmt', 'yuv420p', '-c:v', 'libx264', '-preset', 'ultrafast', '-crf', str(crf)]
+
 
 class TimelapseService:
-    """Service for capturing timelapse images and compiling to video"""
+    """Service for capturing timelapse frames straight into a daily video"""
     
     def __init__(self, camera_manager, settings):
         self.camera = camera_manager
@@ -28,9 +52,16 @@ class TimelapseService:
         self.capture_count = 0
         self.daily_frame_count = 0
         
-        # Frame buffer for incremental compilation
-        self.frame_buffer = []
-        self.buffer_size = 20  # Compile every 20 frames
+        # Persistent ffmpeg encoder fed raw frames over stdin
+        self._encoder = None
+        self._encoder_path = None
+        self._encoder_size = None
+        self._encoder_appends = False  # Output is a segment to append to the daily video
+        self._encoder_frames = 0  # Frames written to the current encoder
+        self._encoder_log_task = None  # Drains the encoder's stderr into the log
+        self._vcodec = None  # Chosen H.264 encoder, probed on first use
+        self._merge_tasks = set()  # Day-close re-encodes of side files still running
+        self.fragment_frames = 20  # Keyframe/fragment every 20 frames: the video grows at this cadence
         
         # Setup storage
         self.base_path = Path(settings.storage.base_path) / "timelapse"
@@ -39,6 +70,7 @@ class TimelapseService:
         
         self.current_date = None
         self.current_video_path = None
+        self._dates_cache = None  # (directory mtime_ns, dates with a video)
         
     async def start(self):
         """Start timelapse service"""
@@ -50,17 +82,23 @@ class TimelapseService:
         """Stop timelapse service"""
         self.is_running = False
         
-        # Compile any remaining frames before stopping
-        if self.frame_buffer:
-            logger.info("Compiling remaining frames before shutdown...")
-            await self._compile_buffer()
-        
         if self.task:
             self.task.cancel()
             try:
                 await self.task
             except asyncio.CancelledError:
                 pass
+        for merge_task in list(self._merge_tasks):
+            merge_task.cancel()
+            try:
+                await merge_task
+            except asyncio.CancelledError:
+                pass
+        
+        # Finish the video with any frames still in the encoder
+        if self._encoder is not None:
+            logger.info("Finalizing timelapse video before shutdown...")
+            await self._close_encoder()
         logger.info("Timelapse service stopped")
     
     def update_settings(self, new_settings):
@@ -72,6 +110,7 @@ class TimelapseService:
         
     async def _capture_loop(self):
         """Main capture loop"""
+        await self._recover_segments()
         while self.is_running:
             try:
                 await self._capture_frame()
@@ -83,7 +122,7 @@ class TimelapseService:
                 await asyncio.sleep(5)
                 
     async def _capture_frame(self):
-        """Capture a single frame and add to buffer"""
+        """Capture a single frame and feed it to the video encoder"""
         frame = self.camera.get_frame()
         if frame is None:
             logger.warning("No frame available for timelapse")
@@ -94,144 +133,384 @@ class TimelapseService:
         
         # Check if we've moved to a new day
         if self.current_date != date_str:
-            # Flush any remaining frames from previous day
-            if self.frame_buffer:
-                await self._compile_buffer()
+            # Finish the previous day's video and fold any side files into it
+            if self._encoder is not None:
+                await self._close_encoder()
+            if self.current_date is not None:
+                self._start_merge([self.current_date])
             
             self.current_date = date_str
             self.current_video_path = self.base_path / f"{date_str}.mp4"
             self.daily_frame_count = 0
             logger.info(f"Started new timelapse for {date_str}")
         
-        # Save frame to temp buffer
-        filename = now.strftime("%Y-%m-%d_%H-%M-%S.jpg")
-        temp_path = self.temp_frames_path / filename
+        # A resolution change needs a new encoder (and a new segment)
+        size = (frame.shape[1], frame.shape[0])
+        if self._encoder is not None and self._encoder_size != size:
+            await self._close_encoder()
+        if self._encoder is None and not await self._open_encoder(size):
+            return
         
-        encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), self.settings.timelapse.quality]
         try:
-            loop = asyncio.get_running_loop()
-            success = await loop.run_in_executor(
-                _io_executor, cv2.imwrite, str(temp_path), frame, encode_param
-            )
-        except Exception as e:
-            logger.error(f"Failed to write frame {filename}: {e}", exc_info=True)
+            # Flat byte view: no copy, and the pipe transport measures it in bytes
+            self._encoder.stdin.write(np.ascontiguousarray(frame).data.cast("B"))
+            await asyncio.wait_for(self._encoder.stdin.drain(), timeout=ENCODER_WRITE_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error("Timelapse encoder stopped accepting frames, restarting it")
+            await self._close_encoder(kill=True)
+            return
+        except (BrokenPipeError, ConnectionResetError) as e:
+            logger.error(f"Timelapse encoder exited unexpectedly: {e}")
+            await self._close_encoder()
             return
         
-        if success:
-            self.frame_buffer.append(str(temp_path))
-            self.capture_count += 1
-            self.daily_frame_count += 1
-            logger.info(f"Timelapse frame captured: {filename} (#{self.capture_count})")
-            
-            # Compile buffer when it reaches threshold
-            if len(self.frame_buffer) >= self.buffer_size:
-                await self._compile_buffer()
-        else:
-            logger.error(f"Failed to save timelapse frame: {filename}")
+        self.capture_count += 1
+        self.daily_frame_count += 1
+        self._encoder_frames += 1
+        logger.info(f"Timelapse frame captured: {now.strftime('%H:%M:%S')} (#{self.capture_count})")
+        
+        # Segments are appended one fragment at a time so the daily video keeps growing
+        if self._encoder_appends and self._encoder_frames >= self.fragment_frames:
+            await self._close_encoder()
     
-    async def _compile_buffer(self):
-        """Compile buffered frames into video segment and append to daily video"""
-        if not self.frame_buffer:
-            return
+    async def _open_encoder(self, size) -> bool:
+        """Start an ffmpeg process encoding raw BGR frames from stdin to H.264"""
+        if self._vcodec is None:
+            self._vcodec = await self._probe_encoder()
         
-        list_file = None
-        temp_segment = None
+        # Stream-copy appends need the same resolution and encoder (SPS/PPS) as
+        # the daily video, which is recorded beside it when it is created
+        width, height = size
+        video_format = f"{width}x{height} {self._vcodec}"
+        format_path = self.current_video_path.with_suffix('.format')
+        stamp = datetime.now().strftime('%H%M%S%f')
+        if not self.current_video_path.exists():
+            output = self.current_video_path
+            appends = False
+            format_path.write_text(video_format)
+        elif await self._video_format(self.current_video_path) == video_format:
+            # The daily video is already finalized (e.g. after a restart): encode
+            # short segments and append each one as it closes
+            output = self.temp_frames_path / f"segment_{self.current_date}_{stamp}.mp4"
+            appends = True
+        else:
+            # Can't be appended without re-encoding the day: keep it as its own
+            # file, which is merged into the daily video when the day closes
+            output = self.base_path / f"{self.current_date}_{stamp}.mp4"
+            appends = False
+            logger.warning(f"Timelapse format changed to {video_format}; "
+                           f"writing {output.name} beside {self.current_video_path.name}")
         
+        # Map the 1-100 quality setting onto x264's CRF scale (90 -> CRF 23)
+        crf = min(51, max(0, round(23 + (90 - self.settings.timelapse.quality) / 4)))
+        input_args, output_args = _codec_args(self._vcodec, crf)
+        cmd = [
+            'ffmpeg', '-y', '-loglevel', 'error',
+            *input_args,
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24',
+            '-s', f'{width}x{height}',
+            '-r', str(self.settings.timelapse.video_fps),
+            '-i', 'pipe:0',
+            *output_args,
+            '-g', str(self.fragment_frames),
+            # Fragmented MP4: playable while still being written, and
+            # everything up to the last fragment survives a crash
+            '-movflags', '+frag_keyframe+empty_moov+default_base_moof',
+            str(output)
+        ]
         try:
-            fps = self.settings.timelapse.video_fps
-            
-            # Create temporary segment
-            temp_segment = self.temp_frames_path / f"segment_{datetime.now().strftime('%H%M%S')}.mp4"
-            
-            # Create file list for ffmpeg
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as f:
-                list_file = f.name
-                for frame_path in self.frame_buffer:
-                    if not Path(frame_path).exists():
-                        logger.warning(f"Frame missing: {frame_path}")
-                        continue
-                    f.write(f"file '{frame_path}'\n")
-                    f.write(f"duration {1.0/fps}\n")
-                # Duplicate last frame
-                if self.frame_buffer:
-                    f.write(f"file '{self.frame_buffer[-1]}'\n")
-            
-            # Compile segment using async subprocess (non-blocking)
+            self._encoder = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+            )
+        except Exception as e:
+            logger.error(f"Failed to start timelapse encoder: {e}")
+            return False
+        
+        self._encoder_log_task = asyncio.create_task(self._log_encoder_output(self._encoder.stderr))
+        self._encoder_path = output
+        self._encoder_size = size
+        self._encoder_appends = appends
+        self._encoder_frames = 0
+        logger.info(f"Encoding timelapse to {output.name} ({width}x{height}, {self._vcodec})")
+        return True
+    
+    async def _log_encoder_output(self, stream):
+        """Log encoder messages as they arrive so a full stderr pipe never blocks ffmpeg"""
+        try:
+            async for line in stream:
+                logger.warning(f"Timelapse encoder: {line.decode(errors='replace').rstrip()}")
+        except Exception as e:
+            logger.debug(f"Timelapse encoder log reader stopped: {e}")
+    
+    async def _video_format(self, video_path: Path):
+        """
+        The "WxH encoder" format recorded beside a daily video. A video without
+        a record (from before records were kept) is probed and the result saved.
+        """
+        format_path = video_path.with_suffix('.format')
+        if format_path.exists():
+            return format_path.read_text()
+        video_format = await self._probe_video_format(video_path)
+        if video_format is not None:
+            format_path.write_text(video_format)
+            logger.info(f"Recorded timelapse format of {video_path.name}: {video_format}")
+        return video_format
+    
+    async def _probe_video_format(self, video_path: Path):
+        """Read "WxH encoder" off a video's stream (ffmpeg's encoder tag), or None"""
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                'ffmpeg', '-hide_banner', '-i', str(video_path),
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            _, stderr = await asyncio.wait_for(proc.communicate(), timeout=10)
+        except Exception as e:
+            logger.warning(f"Could not probe {video_path.name}: {e}")
+            return None
+        
+        # ffmpeg exits non-zero without an output file; the stream info is in stderr
+        info = stderr.decode(errors='replace')
+        size = re.search(r"Video: .*?, (\d+)x(\d+)[ ,]", info)
+        encoder = re.search(r"^\s+encoder\s*:\s*Lavc\S*\s+(\S+)\s*$", info, re.MULTILINE)
+        if size is None or encoder is None:
+            return None
+        return f"{size.group(1)}x{size.group(2)} {encoder.group(1)}"
+    
+    async def _probe_encoder(self) -> str:
+        """First hardware H.264 encoder that can encode a test clip, else libx264"""
+        for codec in HW_ENCODERS:
+            input_args, output_args = _codec_args(codec, 23)
             cmd = [
-                'ffmpeg', '-y', '-loglevel', 'error',
-                '-f', 'concat', '-safe', '0', '-i', list_file,
-                '-vf', f'fps={fps}',
-                '-pix_fmt', 'yuv420p',
-                '-c:v', 'libx264',
-                '-preset', 'ultrafast',  # Fast encoding for real-time
-                '-crf', '23',
-                str(temp_segment)
+                'ffmpeg', '-hide_banner', '-loglevel', 'error',
+                *input_args,
+                '-f', 'lavfi', '-i', 'color=c=black:s=256x256:d=0.2',
+                *output_args,
+                '-f', 'null', '-'
             ]
-            
+            proc = None
             try:
                 proc = await asyncio.create_subprocess_exec(
                     *cmd,
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.DEVNULL,
                 )
-                _, stderr = await asyncio.wait_for(proc.communicate(), timeout=60)
-                
-                if proc.returncode != 0:
-                    logger.error(f"Failed to compile segment: {stderr.decode()}")
-                    return
+                if await asyncio.wait_for(proc.wait(), timeout=10) == 0:
+                    logger.info(f"Timelapse using hardware encoder {codec}")
+                    return codec
             except asyncio.TimeoutError:
-                logger.error("FFmpeg segment compilation timed out")
                 try:
                     proc.kill()
+                    await proc.wait()  # Reap the killed process
                 except Exception:
                     pass
-                return
-            
-            # Append to daily video or create new
-            if self.current_video_path.exists():
-                # Append to existing video
-                await self._append_to_video(temp_segment)
+            except Exception as e:
+                logger.debug(f"Encoder probe for {codec} failed: {e}")
+        logger.info("No hardware H.264 encoder available, using libx264")
+        return "libx264"
+    
+    async def _close_encoder(self, kill: bool = False):
+        """
+        Flush and finish the current encoder, appending its segment if needed.
+        ``kill`` stops a hung encoder instead of waiting for it to flush.
+        """
+        proc = self._encoder
+        log_task = self._encoder_log_task
+        self._encoder = None
+        self._encoder_log_task = None
+        if proc is None:
+            return
+        
+        try:
+            if kill:
+                proc.kill()
             else:
-                # First segment of the day - just rename it
-                shutil.move(str(temp_segment), str(self.current_video_path))
-                logger.info(f"Created daily video: {self.current_video_path.name}")
-            
-            # Clean up temp segment if it still exists
-            if temp_segment and temp_segment.exists():
-                temp_segment.unlink()
-            
-            # Delete processed frames
-            for frame_path in self.frame_buffer:
-                try:
-                    Path(frame_path).unlink()
-                except Exception as e:
-                    logger.warning(f"Failed to delete temp frame {frame_path}: {e}")
-            
-            logger.info(f"Compiled {len(self.frame_buffer)} frames into video segment")
-            self.frame_buffer = []
-            
+                proc.stdin.close()
+            await asyncio.wait_for(proc.wait(), timeout=60)
+        except asyncio.TimeoutError:
+            logger.error("FFmpeg encoder did not finish in time")
+            try:
+                proc.kill()
+                await proc.wait()  # Reap the killed process
+            except Exception:
+                pass
+            return
         except Exception as e:
-            logger.error(f"Error compiling buffer: {e}", exc_info=True)
+            logger.error(f"Error finishing timelapse encoder: {e}")
+            return
         finally:
-            # Clean up list file
-            if list_file and Path(list_file).exists():
+            if log_task is not None:
+                # stderr hits EOF once ffmpeg has exited
                 try:
-                    Path(list_file).unlink()
-                except Exception as e:
-                    logger.warning(f"Failed to delete list file: {e}")
+                    await asyncio.wait_for(log_task, timeout=5)
+                except Exception:
+                    log_task.cancel()
+        
+        if proc.returncode != 0:
+            logger.error(f"Timelapse encoder exited with code {proc.returncode}")
+            if self._vcodec != "libx264":
+                logger.warning(f"Falling back from {self._vcodec} to libx264")
+                self._vcodec = "libx264"
+            if not self._encoder_appends:
+                # Killed before its first fragment was flushed: the file holds no
+                # frames and would break every later append, so drop it
+                if self._encoder_frames <= self.fragment_frames:
+                    self._encoder_path.unlink(missing_ok=True)
+                    if self._encoder_path == self.current_video_path:
+                        self._encoder_path.with_suffix('.format').unlink(missing_ok=True)
+                return
+            # Fragmented output is valid up to its last fragment, so still append it
+        
+        if self._encoder_appends and self._encoder_path.exists():
+            await self._append_segment(self.current_video_path, self._encoder_path)
+        logger.info(f"Finished timelapse video segment: {self._encoder_path.name}")
+    
+    async def _append_segment(self, video_path: Path, segment_path: Path):
+        """Append a segment to its daily video, removing it only once it is in"""
+        if await self._append_to_video(video_path, segment_path):
+            segment_path.unlink(missing_ok=True)
+        else:
+            # Keep the frames; the segment is retried on the next start
+            logger.error(f"Keeping unappended timelapse segment {segment_path.name}")
+    
+    async def _recover_segments(self):
+        """Append segments left in temp by a crash or failed append, oldest first"""
+        for leftover in self.base_path.glob("*.tmp.mp4"):
+            leftover.unlink(missing_ok=True)  # Partial output of an interrupted append
+        
+        for segment in sorted(self.temp_frames_path.glob("segment_*.mp4")):
+            date_str = segment.stem.split("_")[1]
+            if not _DATE_RE.fullmatch(date_str):
+                continue
+            video_path = self.get_video_path(date_str)
+            if not video_path.exists():
+                # The segment is all there is of that day; record its format so
+                # the rest of the day keeps appending to it
+                segment.replace(video_path)
+                video_path.with_suffix('.format').unlink(missing_ok=True)
+                await self._video_format(video_path)
+                logger.info(f"Recovered timelapse segment {segment.name} as {video_path.name}")
+                continue
+            logger.info(f"Recovering timelapse segment {segment.name}")
+            await self._append_segment(video_path, segment)
+        
+        # Side files of days that closed while the service was down
+        today = datetime.now().strftime('%Y-%m-%d')
+        past_dates = sorted({
+            path.stem.split("_")[0] for path in self.base_path.glob("*_*.mp4")
+            if _DATE_RE.fullmatch(path.stem.split("_")[0]) and path.stem.split("_")[0] < today
+        })
+        if past_dates:
+            self._start_merge(past_dates)
+    
+    async def _kill(self, proc):
+        """Kill and reap an ffmpeg process, if it was started"""
+        try:
+            proc.kill()
+            await proc.wait()  # Reap the killed process
+        except Exception:
+            pass
     
-    async def _append_to_video(self, segment_path: Path):
-        """Append video segment to daily video (non-blocking)"""
+    def _start_merge(self, dates: list):
+        """Merge the side files of closed days into their daily videos in the background"""
+        task = asyncio.create_task(self._merge_side_files(dates))
+        self._merge_tasks.add(task)
+        task.add_done_callback(self._merge_tasks.discard)
+    
+    async def _merge_side_files(self, dates: list):
+        """Re-encode each day's video and its side files into one daily video"""
+        for date_str in dates:
+            side_files = sorted(self.base_path.glob(f"{date_str}_*.mp4"))
+            if side_files:
+                await self._merge_day(date_str, side_files)
+    
+    async def _merge_day(self, date_str: str, side_files: list):
+        """
+        Join a daily video and its side files (different resolution or encoder)
+        by re-encoding them at the daily video's size. The side files hold later
+        frames, so they follow the daily video.
+        """
+        video_path = self.get_video_path(date_str)
+        if video_path.exists():
+            inputs = [video_path, *side_files]
+            video_format = await self._video_format(video_path)
+        else:
+            inputs = side_files
+            video_format = await self._probe_video_format(side_files[0])
+        if video_format is None:
+            logger.error(f"Cannot merge timelapse side files of {date_str}: unreadable {inputs[0].name}")
+            return
+        width, height = video_format.split()[0].split('x')
+        
+        # Scale (letterboxed) every input to the daily video's size, then concatenate
+        fps = self.settings.timelapse.video_fps
+        filters = [
+            f"[{i}:v]scale={width}:{height}:force_original_aspect_ratio=decrease,"
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={fps}[v{i}]"
+            for i in range(len(inputs))
+        ]
+        labels = "".join(f"[v{i}]" for i in range(len(inputs)))
+        filters.append(f"{labels}concat=n={len(inputs)}:v=1:a=0[out]")
+        
+        crf = min(51, max(0, round(23 + (90 - self.settings.timelapse.quality) / 4)))
+        _, output_args = _codec_args("libx264", crf)
+        temp_output = video_path.with_suffix('.tmp.mp4')
+        cmd = ['ffmpeg', '-y', '-loglevel', 'error']
+        for path in inputs:
+            cmd += ['-i', str(path)]
+        cmd += [
+            '-filter_complex', ";".join(filters), '-map', '[out]',
+            *output_args,
+            '-g', str(self.fragment_frames),
+            '-movflags', '+frag_keyframe+empty_moov+default_base_moof',
+            str(temp_output)
+        ]
+        
+        logger.info(f"Merging {len(side_files)} timelapse side file(s) into {video_path.name}")
+        proc = None
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            _, stderr = await asyncio.wait_for(proc.communicate(), timeout=MERGE_TIMEOUT)
+            if proc.returncode != 0:
+                logger.error(f"Failed to merge timelapse side files: {stderr.decode(errors='replace')}")
+                return
+            os.replace(temp_output, video_path)
+            video_path.with_suffix('.format').write_text(f"{width}x{height} libx264")
+            for path in side_files:
+                path.unlink(missing_ok=True)
+            logger.info(f"Merged timelapse side files into {video_path.name}")
+        except asyncio.TimeoutError:
+            logger.error(f"Timelapse merge of {date_str} timed out; retried on next start")
+            await self._kill(proc)
+        except asyncio.CancelledError:
+            # Shutting down: the side files stay and are merged on the next start
+            await self._kill(proc)
+            raise
+        except Exception as e:
+            logger.error(f"Error merging timelapse side files: {e}")
+        finally:
+            temp_output.unlink(missing_ok=True)
+    
+    async def _append_to_video(self, video_path: Path, segment_path: Path) -> bool:
+        """Append video segment to daily video (non-blocking); True on success"""
         concat_file = None
+        proc = None
         try:
             # Create concat list
             with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as f:
                 concat_file = f.name
-                f.write(f"file '{self.current_video_path.absolute()}'\n")
+                f.write(f"file '{video_path.absolute()}'\n")
                 f.write(f"file '{segment_path.absolute()}'\n")
             
             # Create temp output
-            temp_output = self.current_video_path.with_suffix('.tmp.mp4')
+            temp_output = video_path.with_suffix('.tmp.mp4')
             
             # Concatenate videos using async subprocess
             cmd = [
@@ -249,19 +528,21 @@ class TimelapseService:
             _, stderr = await asyncio.wait_for(proc.communicate(), timeout=30)
             
             if proc.returncode == 0:
-                shutil.move(str(temp_output), str(self.current_video_path))
+                shutil.move(str(temp_output), str(video_path))
                 logger.info("Appended segment to daily video")
-            else:
-                logger.error(f"Failed to append segment: {stderr.decode()}")
-                if temp_output.exists():
-                    temp_output.unlink()
+                return True
+            logger.error(f"Failed to append segment: {stderr.decode()}")
+            if temp_output.exists():
+                temp_output.unlink()
                     
         except asyncio.TimeoutError:
             logger.error("FFmpeg append timed out")
             try:
                 proc.kill()
+                await proc.wait()  # Reap the killed process
             except Exception:
                 pass
+            temp_output.unlink(missing_ok=True)  # Drop the partial output
         except Exception as e:
             logger.error(f"Error appending to video: {e}")
         finally:
@@ -270,6 +551,11 @@ class TimelapseService:
                     Path(concat_file).unlink()
                 except Exception:
                     pass
+        return False
+            
+    def is_writing(self, path: Path) -> bool:
+        """Whether the encoder is currently writing (growing) this file"""
+        return self._encoder is not None and self._encoder_path == path
             
     def get_stats(self) -> dict:
         """Get service statistics"""
@@ -278,28 +564,34 @@ class TimelapseService:
             "is_running": self.is_running,
             "capture_count": self.capture_count,
             "daily_frame_count": self.daily_frame_count,
-            "buffer_size": len(self.frame_buffer),
+            # Frames encoded but not yet in a finished fragment of the video
+            "buffer_size": self.daily_frame_count % self.fragment_frames if self._encoder else 0,
             "interval": self.settings.timelapse.interval,
             "storage_path": str(self.base_path),
             "current_video": str(self.current_video_path) if self.current_video_path else None
         }
         
+    def _video_dates(self) -> set:
+        """Dates with a daily video, rescanned only when the directory's mtime changes"""
+        try:
+            mtime_ns = os.stat(self.base_path).st_mtime_ns
+        except FileNotFoundError:
+            return set()
+        if self._dates_cache is None or self._dates_cache[0] != mtime_ns:
+            with os.scandir(self.base_path) as entries:
+                dates = {
+                    entry.name[:-4] for entry in entries
+                    if entry.name.endswith('.mp4') and _DATE_RE.fullmatch(entry.name[:-4])
+                    and entry.is_file()
+                }
+            self._dates_cache = (mtime_ns, dates)
+        return self._dates_cache[1]
+    
     def get_available_dates(self) -> list:
         """Get list of dates with compiled timelapse videos or current day"""
-        dates = set()
-        
         # Add current date (even if video not compiled yet)
-        from datetime import datetime
         today = datetime.now().strftime('%Y-%m-%d')
-        dates.add(today)
-        
-        # Add dates from existing MP4 files
-        if self.base_path.exists():
-            for video_file in sorted(self.base_path.glob("*.mp4"), reverse=True):
-                if video_file.stem != "temp":  # Skip temp files
-                    dates.add(video_file.stem)
-        
-        return sorted(list(dates), reverse=True)
+        return sorted(self._video_dates() | {today}, reverse=True)
         
     def get_video_path(self, date: str) -> Path:
         """Get path to compiled video for a specific date"""
@@ -307,8 +599,8 @@ class TimelapseService:
     
     def get_frames_for_date(self, date: str) -> list:
         """Get video info for a specific date (for backward compatibility)"""
-        video_path = self.get_video_path(date)
-        if video_path.exists():
+        if date in self._video_dates():
+            video_path = self.get_video_path(date)
             return [{
                 "type": "video",
                 "path": str(video_path.relative_to(self.base_path.parent)),
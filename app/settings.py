@@ -2,11 +2,23 @@
 Settings management module for SkyWatch
 Handles reading and updating configuration
 """
+import copy
+import logging
+import os
+import shutil
 import yaml
 from pathlib import Path
 from typing import Dict, Any
 from pydantic import BaseModel, Field
 
+# libyaml's C loader/dumper when PyYAML was built with it, pure-Python otherwise
+try:
+    from yaml import CSafeLoader as _YamlLoader, CSafeDumper as _YamlDumper
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader, SafeDumper as _YamlDumper
+
+logger = logging.getLogger(__name__)
+
 
 class CameraSettings(BaseModel):
     rtsp_url: str = Field(..., description="Camera RTSP URL")
@@ -57,6 +69,7 @@ class MotionSettings(BaseModel):
     burst_count: int = Field(10, ge=1, le=100)
     burst_fps: int = Field(10, ge=1, le=30)
     cooldown: int = Field(5, ge=0, le=60)
+    frame_skip: int = Field(1, ge=1, le=10, description="Checks between the three compared frames")
 
 
 class ServerSettings(BaseModel):
@@ -84,43 +97,57 @@ class AllSettings(BaseModel):
 
 CONFIG_FILE = Path("config.yaml")
 
+# ((mtime_ns, size), parsed config) of the last load; re-parsed only when the file changes
+_cache = None
+
 
 def load_settings() -> Dict[str, Any]:
     """Load settings from config.yaml"""
-    if not CONFIG_FILE.exists():
-        raise FileNotFoundError("config.yaml not found")
+    global _cache
+    try:
+        st = CONFIG_FILE.stat()
+    except FileNotFoundError:
+        raise FileNotFoundError("config.yaml not found") from None
     
-    with open(CONFIG_FILE, 'r') as f:
-        return yaml.safe_load(f)
+    key = (st.st_mtime_ns, st.st_size)
+    if _cache is None or _cache[0] != key:
+        # libyaml parses a bytes buffer in one pass instead of pulling text chunks
+        _cache = (key, yaml.load(CONFIG_FILE.read_bytes(), Loader=_YamlLoader))
+    # Callers may modify what they get back
+    return copy.deepcopy(_cache[1])
 
 
 def save_settings(settings: Dict[str, Any]) -> bool:
     """Save settings to config.yaml"""
+    global _cache
+    _cache = None
+    tmp_file = CONFIG_FILE.with_name(CONFIG_FILE.name + ".tmp")
     try:
         # Backup current config
         backup_file = Path("config.yaml.backup")
         if CONFIG_FILE.exists():
-            import shutil
-            shutil.copy(CONFIG_FILE, backup_file)
+            shutil.copy2(CONFIG_FILE, backup_file)
         
-        # Write new settings
-        with open(CONFIG_FILE, 'w') as f:
-            yaml.dump(settings, f, default_flow_style=False, sort_keys=False)
+        # Write new settings beside the config and swap it in atomically, so a
+        # crash mid-write never leaves a truncated config.yaml
+        data = yaml.dump(settings, Dumper=_YamlDumper, default_flow_style=False, sort_keys=False)
+        tmp_file.write_bytes(data.encode('utf-8'))
+        os.replace(tmp_file, CONFIG_FILE)
         
         return True
     except Exception as e:
-        print(f"Error saving settings: {e}")
-        # Restore backup if save failed
-        if backup_file.exists():
-            import shutil
-            shutil.copy(backup_file, CONFIG_FILE)
+        logger.error(f"Error saving settings: {e}")
         return False
+    finally:
+        if tmp_file.exists():
+            tmp_file.unlink()
 
 
 def validate_settings(settings: Dict[str, Any]) -> tuple[bool, str]:
     """Validate settings before saving"""
     try:
-        AllSettings(**settings)
+        # Validate the dict directly through the model's compiled schema
+        AllSettings.model_validate(settings)
         return True, "Settings are valid"
     except Exception as e:
         return False, str(e)
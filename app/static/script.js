@@ -513,7 +513,8 @@ function getSettingsFromForm() {
             min_area: parseInt(document.getElementById('motion-min-area').value),
             burst_count: parseInt(document.getElementById('motion-burst-count').value),
             burst_fps: parseInt(document.getElementById('motion-burst-fps').value),
-            cooldown: parseInt(document.getElementById('motion-cooldown').value)
+            cooldown: parseInt(document.getElementById('motion-cooldown').value),
+            frame_skip: currentSettings.motion?.frame_skip || 1
         },
         server: currentSettings.server || {
             host: "0.0.0.0",
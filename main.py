@@ -3,6 +3,7 @@ SkyWatch - Smart Camera Capture System
 Main application entry point
 """
 import asyncio
+import importlib
 import logging
 from contextlib import asynccontextmanager
 
@@ -13,10 +14,6 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
 from app.camera import CameraManager
 from app.api import router
-from app.services.timelapse import TimelapseService
-from app.services.solargraph import SolargraphService
-from app.services.lunar import LunarService
-from app.services.motion import MotionDetectionService
 
 # Configure logging
 logging.basicConfig(
@@ -25,12 +22,22 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# (settings section, module, class, label) of each capture service; modules are
+# imported only when their service is enabled
+SERVICE_TABLE = [
+    ("timelapse", "app.services.timelapse", "TimelapseService", "Timelapse"),
+    ("solargraph", "app.services.solargraph", "SolargraphService", "Solargraph"),
+    ("lunar", "app.services.lunar", "LunarService", "Lunar"),
+    ("motion", "app.services.motion", "MotionDetectionService", "Motion detection"),
+]
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup and shutdown events"""
     
     logger.info("Starting SkyWatch...")
+    logger.info(f"Event loop: {type(asyncio.get_running_loop()).__module__}")
     
     # Initialize camera
     camera_manager = CameraManager(settings.camera.rtsp_url)
@@ -42,29 +49,20 @@ async def lifespan(app: FastAPI):
     app.state._tasks = []  # Track background tasks for error handling
     
     # Initialize and start services
-    if settings.timelapse.enabled:
-        timelapse_service = TimelapseService(camera_manager, settings)
-        app.state.services.append(timelapse_service)
-        await timelapse_service.start()
-        logger.info("Timelapse service started")
-    
-    if settings.solargraph.enabled:
-        solargraph_service = SolargraphService(camera_manager, settings)
-        app.state.services.append(solargraph_service)
-        await solargraph_service.start()
-        logger.info("Solargraph service started")
+    labels = []
+    for section, module, class_name, label in SERVICE_TABLE:
+        if getattr(settings, section).enabled:
+            service_class = getattr(importlib.import_module(module), class_name)
+            app.state.services.append(service_class(camera_manager, settings))
+            labels.append(label)
     
-    if settings.lunar.enabled:
-        lunar_service = LunarService(camera_manager, settings)
-        app.state.services.append(lunar_service)
-        await lunar_service.start()
-        logger.info("Lunar service started")
+    # Services are independent, so their start-up work overlaps
+    await asyncio.gather(*(service.start() for service in app.state.services))
+    for label in labels:
+        logger.info(f"{label} service started")
     
-    if settings.motion.enabled:
-        motion_service = MotionDetectionService(camera_manager, settings)
-        app.state.services.append(motion_service)
-        await motion_service.start()
-        logger.info("Motion detection service started")
+    # Index services by class name for O(1) lookup in the API routes
+    app.state.services_by_name = {s.__class__.__name__: s for s in app.state.services}
     
     # Set up a global exception handler for unhandled task errors
     loop = asyncio.get_running_loop()
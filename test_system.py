@@ -4,6 +4,7 @@ SkyWatch System Test Script
 Tests basic functionality without requiring camera connection
 """
 import sys
+import functools
 import importlib.util
 
 def test_imports():
@@ -19,12 +20,13 @@ def test_imports():
         'astral': 'astral',
     }
     
+    # Only check presence here; find_spec doesn't run the (heavy) module bodies,
+    # and test_modules() imports the app for real afterwards
     failed = []
     for module, package in required_packages.items():
-        try:
-            __import__(module)
+        if importlib.util.find_spec(module) is not None:
             print(f"  ✓ {package}")
-        except ImportError:
+        else:
             print(f"  ✗ {package} - NOT INSTALLED")
             failed.append(package)
     
@@ -36,12 +38,17 @@ def test_imports():
     print("\n✓ All packages installed\n")
     return True
 
+@functools.lru_cache(maxsize=1)
+def _cached_config():
+    """Load the configuration once for every phase of the run"""
+    from app.config import load_config
+    return load_config()
+
 def test_config():
     """Test configuration loading"""
     print("Testing configuration...")
     try:
-        from app.config import load_config
-        settings = load_config()
+        settings = _cached_config()
         print(f"  ✓ Configuration loaded")
         print(f"  ✓ RTSP URL: {settings.camera.rtsp_url[:30]}...")
         print(f"  ✓ Storage: {settings.storage.base_path}")
@@ -61,8 +68,7 @@ def test_storage():
     print("Testing storage...")
     try:
         from pathlib import Path
-        from app.config import load_config
-        settings = load_config()
+        settings = _cached_config()
         
         base_path = Path(settings.storage.base_path)
         if not base_path.exists():